@@ -67,14 +67,101 @@ SFA｜戦略ダッシュボード - OS v1.5.4
   WHERE original_maker = '削除したいメーカー名';
 
 ================================================================================
+================================================================================
+【得意先ディメンション】dim_customer_snapshot
+================================================================================
+
+新規納品トレンドの得意先名・グループ名は、毎回 VIEW_UNIFIED 全体を
+得意先コードで集約して求めていた。VIEW_UNIFIED はビューのため
+MATERIALIZED VIEW は作成できないので、日次のスケジュールクエリで
+スナップショットテーブルを作成し、アプリは存在すればそちらを参照する
+（無い場合は従来どおり VIEW_UNIFIED を都度集約）。
+
+▼ テーブル: salesdb-479915.sales_data.dim_customer_snapshot
+  列: customer_code  STRING
+  列: customer_name  STRING
+  列: group_name     STRING
+
+▼ スケジュールクエリ（日次）:
+  CREATE OR REPLACE TABLE `salesdb-479915.sales_data.dim_customer_snapshot`
+  CLUSTER BY customer_code AS
+  SELECT
+    CAST(customer_code AS STRING) AS customer_code,
+    ANY_VALUE(CAST(customer_name AS STRING)) AS customer_name,
+    ANY_VALUE(COALESCE(NULLIF(CAST(customer_group_display AS STRING), ''), '未設定')) AS group_name
+  FROM `salesdb-479915.sales_data.v_sales_fact_unified_grouped`
+  GROUP BY customer_code;
+
+================================================================================
+【新規納品 日次サマリー】nd_daily_summary
+================================================================================
+
+新規納品のサマリー・トレンド・明細は、いずれも VIEW_NEW_DELIVERY を
+初回納品日の期間で絞り、得意先 / JAN / 商品名 / 担当者の粒度で集計している。
+VIEW_NEW_DELIVERY もビューのため MATERIALIZED VIEW は作成できないので、
+日次のスケジュールクエリ（取込完了後）で同じ粒度まで集約したテーブルを作成し、
+アプリは存在すればそちらを参照する（無い場合は従来どおり VIEW_NEW_DELIVERY）。
+
+▼ テーブル: salesdb-479915.sales_data.nd_daily_summary
+  列: first_sales_date  DATE
+  列: customer_code     STRING
+  列: jan_code          STRING
+  列: product_name      STRING
+  列: login_email       STRING
+  列: sales_amount      FLOAT64
+  列: gross_profit      FLOAT64
+
+▼ スケジュールクエリ（日次）:
+  CREATE OR REPLACE TABLE `salesdb-479915.sales_data.nd_daily_summary`
+  PARTITION BY first_sales_date
+  CLUSTER BY login_email, customer_code, jan_code AS
+  SELECT
+    CAST(first_sales_date AS DATE) AS first_sales_date,
+    CAST(customer_code AS STRING) AS customer_code,
+    CAST(jan_code AS STRING) AS jan_code,
+    CAST(product_name AS STRING) AS product_name,
+    login_email,
+    SUM(sales_amount) AS sales_amount,
+    SUM(gross_profit) AS gross_profit
+  FROM `salesdb-479915.sales_data.v_new_deliveries_realized_daily_fact_all_months`
+  GROUP BY 1, 2, 3, 4, 5;
+
+================================================================================
+【VIEW_UNIFIED 元テーブルのパーティション / クラスタリング】
+================================================================================
+
+アプリ側の集計クエリは fiscal_year をクエリパラメータ（定数）で絞り込み、
+得意先コード・YJコードで要因分析を行う。元テーブルを以下の構成で
+作り直し、v_sales_fact_unified_grouped をその上に再定義すると
+読み取りブロックが絞られる（アプリ側の変更は不要）。
+
+  CREATE TABLE `salesdb-479915.sales_data.<元テーブル>_clustered`
+  PARTITION BY DATE_TRUNC(sales_date, MONTH)
+  CLUSTER BY fiscal_year, customer_code, yj_code AS
+  SELECT * FROM `salesdb-479915.sales_data.<元テーブル>`;
+
 """
 
 from __future__ import annotations
 
+import hashlib
+import hmac
+import importlib.util
+import re
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Tuple, Iterable, List
-
+from datetime import date, datetime
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Optional, Tuple, Iterable, List, Mapping
+from zoneinfo import ZoneInfo
+
+import db_dtypes
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import streamlit as st
 from google.cloud import bigquery
 from google.oauth2 import service_account
@@ -86,6 +173,12 @@ from pandas.api.types import is_numeric_dtype
 # -----------------------------
 APP_TITLE = "SFA｜戦略ダッシュボード"
 DEFAULT_LOCATION = "asia-northeast1"
+APP_TZ = ZoneInfo("Asia/Tokyo")
+# 基準日は Python 側で JST の日付を求めて @today パラメータで渡す。
+# CURRENT_DATE を含むクエリは BigQuery の結果キャッシュ対象外になるため、SQL には書かない
+SQL_TODAY = "@today"
+# 前年同日（前年同期の締め日）。定数式なので CTE を CROSS JOIN せず直接埋め込む
+SQL_PY_TODAY = f"DATE_SUB({SQL_TODAY}, INTERVAL 1 YEAR)"
 PROJECT_DEFAULT = "salesdb-479915"
 DATASET_DEFAULT = "sales_data"
 
@@ -94,13 +187,93 @@ VIEW_ROLE_CLEAN = f"{PROJECT_DEFAULT}.{DATASET_DEFAULT}.dim_staff_role_clean"
 VIEW_NEW_DELIVERY = f"{PROJECT_DEFAULT}.{DATASET_DEFAULT}.v_new_deliveries_realized_daily_fact_all_months"
 VIEW_RECOMMEND = f"{PROJECT_DEFAULT}.{DATASET_DEFAULT}.v_sales_recommendation_engine"
 VIEW_ADOPTION = f"{PROJECT_DEFAULT}.{DATASET_DEFAULT}.v_customer_adoption_status"
-
-CUSTOMER_GROUP_COLUMN_CANDIDATES = (
-    "customer_group_display",
-    "customer_group_official",
-    "customer_group_raw",
-    "sales_group_name",
+TABLE_CUSTOMER_DIM = f"{PROJECT_DEFAULT}.{DATASET_DEFAULT}.dim_customer_snapshot"
+TABLE_ND_DAILY = f"{PROJECT_DEFAULT}.{DATASET_DEFAULT}.nd_daily_summary"
+ND_DAILY_COLUMNS = (
+    "first_sales_date",
+    "customer_code",
+    "jan_code",
+    "product_name",
+    "login_email",
+    "sales_amount",
+    "gross_profit",
+)
+# 起動時に列構成を一括取得する VIEW（INFORMATION_SCHEMA を1回で引く）
+SCHEMA_PROBE_VIEWS = (VIEW_UNIFIED, VIEW_NEW_DELIVERY, VIEW_ROLE_CLEAN, TABLE_CUSTOMER_DIM, TABLE_ND_DAILY)
+
+ADMIN_ROLE_KEYWORDS = ("ADMIN", "MANAGER", "HQ")
+_ADMIN_ROLE_RE = re.compile("|".join(map(re.escape, ADMIN_ROLE_KEYWORDS)))
+
+# 採用アイテムは得意先ごとにこの件数ずつ読み込む
+ADOPTION_PREVIEW_ROWS = 200
+# 年度累計サマリー（ORG / ME）の保持秒数。キーに JST の日付を含むので日付が変われば引き直す
+FYTD_CACHE_TTL_SEC = 3600
+# 新規納品の得意先数・品目数は HyperLogLog の概数で数える（監査で厳密値が要るときは False）
+USE_APPROX_COUNTS = True
+ND_COUNT_COLUMNS = ("得意先数", "品目数", "JAN数")
+# 新規納品トレンドの親一覧はセッション内で (期間, 表示単位) ごとに保持する（件数上限・有効秒数）
+ND_PARENT_CACHE_MAX = 10
+ND_PARENT_CACHE_TTL_SEC = 600
+# 明細は1ページ分だけ整形・送信する
+DETAIL_PAGE_ROWS = 100
+# 新規納品トレンド: 集計列 → 表示名（親一覧・明細共通）と、表示単位ごとの表示列・選択キー列
+ND_TREND_RENAME = {
+    "group_name": "グループ",
+    "customer_code": "得意先コード",
+    "customer_name": "得意先名",
+    "prod_key": "商品キー",
+    "product_name": "商品名",
+    "customer_cnt": "得意先数",
+    "item_cnt": "品目数",
+    "jan_cnt": "JAN数",
+    "sales_amount": "売上",
+    "gross_profit": "粗利",
+    "first_sales_date": "初回納品日",
+    "first_sales_date_min": "初回納品日（最小）",
+}
+ND_TREND_VIEWS = {
+    "group_name": (["グループ", "得意先数", "品目数", "売上", "粗利"], "グループ"),
+    "customer_code": (["得意先コード", "得意先名", "グループ", "品目数", "売上", "粗利"], "得意先コード"),
+    "prod_key": (["商品キー", "商品名", "得意先数", "JAN数", "売上", "粗利"], "商品キー"),
+}
+REC_TOP_N = 10
+REC_FIELDS = (
+    ("priority_rank", "順位"),
+    ("recommend_product", "推奨商品"),
+    ("manufacturer", "メーカー"),
 )
+_REC_SELECT_CLAUSE = ",\n            ".join(f"{col} AS `{alias}`" for col, alias in REC_FIELDS)
+SQL_RECOMMEND_BY_CUSTOMERS = f"""
+        SELECT
+            CAST(customer_code AS STRING) AS customer_code,
+            {_REC_SELECT_CLAUSE}
+        FROM `{VIEW_RECOMMEND}`
+        WHERE CAST(customer_code AS STRING) IN UNNEST(@codes)
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY CAST(customer_code AS STRING) ORDER BY priority_rank ASC) <= {REC_TOP_N}
+        ORDER BY customer_code, priority_rank ASC
+"""
+SMALL_LIMIT_MAX_ROWS = 1000
+# 絞り込み漏れ等で想定外のフルスキャンになったクエリは実行前に失敗させる（課金上限）
+MAX_BYTES_BILLED = 10 * 1024**3
+_JOB_LABEL_INVALID_RE = re.compile(r"[^a-z0-9_-]+")
+BQSTORAGE_MIN_ROWS = 10_000
+# google-cloud-bigquery-storage が無い環境では Storage API を要求しない（毎回の警告とフォールバックを避ける）
+BQSTORAGE_AVAILABLE = importlib.util.find_spec("google.cloud.bigquery_storage") is not None
+_TRAILING_LIMIT_RE = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+# 表示専用の結果は STRING 列を Arrow 文字列で受け取り、描画時の Arrow 再変換を省く
+ARROW_STRING_DTYPE = pd.StringDtype("pyarrow")
+# 大きい結果の Arrow → pandas 変換で使う型対応（to_dataframe の既定と同じ nullable 型・dbdate / dbtime に揃え、
+# 行数で Storage API 経由かどうかが変わっても同じクエリは同じ dtype で返す）
+_ARROW_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+    pa.date32(): db_dtypes.DateDtype(),
+    pa.time64("us"): db_dtypes.TimeDtype(),
+}
+_ARROW_TYPES_WITH_STRINGS = {**_ARROW_TYPES, pa.string(): ARROW_STRING_DTYPE, pa.large_string(): ARROW_STRING_DTYPE}
+# dbdate は ns 精度の datetime64 で保持するため、範囲外の日付（9999-12-31 等）を含むときは to_dataframe と同じく object にする
+_NS_DATE_MIN = pd.Timestamp.min.date()
+_NS_DATE_MAX = pd.Timestamp.max.date()
 
 
 # -----------------------------
@@ -112,22 +285,76 @@ def set_page() -> None:
     st.caption("OS v1.5.3｜対薬価率 = 薬価あり売上 ÷ 総薬価 × 100（薬価比表示）")
 
 
-def create_default_column_config(df: pd.DataFrame) -> Dict[str, st.column_config.Column]:
+_PCT_COL_RE = re.compile("率|比|ペース|成長")
+_MONEY_COL_RE = re.compile("売上|粗利|金額|差額|実績|予測|GAP")
+# 金額列の表示書式（¥1,234 形式。Streamlit の NumberColumn プリセット）
+YEN_COLUMN_FORMAT = "yen"
+YOY_BREAKDOWN_MONEY_COLS = ["今期売上", "前期売上", "前年差額"]
+
+
+@lru_cache(maxsize=512)
+def _column_name_kind(col: str) -> str:
+    # 列名だけで決まる分類（率 > 金額 > 日付）。列名単位で覚えるので別スキーマでも判定を再利用できる
+    if _PCT_COL_RE.search(col):
+        return "pct"
+    if _MONEY_COL_RE.search(col):
+        return "money"
+    if "日" in col:
+        return "date"
+    return ""
+
+
+@lru_cache(maxsize=64)
+def _column_config_for_schema(schema: Tuple[Tuple[str, Any], ...]) -> Dict[str, st.column_config.Column]:
     config: Dict[str, st.column_config.Column] = {}
-    for col in df.columns:
-        if any(k in col for k in ["率", "比", "ペース", "成長"]):
+    for col, dtype in schema:
+        kind = _column_name_kind(col)
+        if kind == "pct":
             config[col] = st.column_config.NumberColumn(col, format="%.1f%%")
-        elif any(k in col for k in ["売上", "粗利", "金額", "差額", "実績", "予測", "GAP"]):
+        elif kind == "money":
             config[col] = st.column_config.NumberColumn(col)
-        elif "日" in col or pd.api.types.is_datetime64_any_dtype(df[col]):
+        elif kind == "date" or pd.api.types.is_datetime64_any_dtype(dtype):
             config[col] = st.column_config.DateColumn(col, format="YYYY-MM-DD")
-        elif is_numeric_dtype(df[col]):
+        elif is_numeric_dtype(dtype):
             config[col] = st.column_config.NumberColumn(col)
         else:
             config[col] = st.column_config.TextColumn(col)
     return config
 
 
+def create_default_column_config(df: pd.DataFrame) -> Dict[str, st.column_config.Column]:
+    # 列名と dtype が同じなら分類結果を再利用（再実行ごとの判定を省略）
+    return dict(_column_config_for_schema(tuple(df.dtypes.items())))
+
+
+def display_column_config(
+    money_cols: List[str],
+    pct_cols: Optional[List[str]] = None,
+    date_cols: Optional[List[str]] = None,
+    base: Optional[Dict[str, st.column_config.Column]] = None,
+) -> Dict[str, st.column_config.Column]:
+    # 書式はブラウザ側で適用する（Styler の HTML 生成をサーバで行わない）
+    config: Dict[str, st.column_config.Column] = dict(base or {})
+    for col in money_cols:
+        config[col] = st.column_config.NumberColumn(col, format=YEN_COLUMN_FORMAT)
+    for col in pct_cols or []:
+        config[col] = st.column_config.NumberColumn(col, format="%.1f%%")
+    for col in date_cols or []:
+        config[col] = st.column_config.DateColumn(col, format="YYYY-MM-DD")
+    return config
+
+
+def nd_count_column_config(columns: Iterable[str]) -> Dict[str, st.column_config.Column]:
+    # 概数で数えているときだけ件数列に注記を付ける
+    if not USE_APPROX_COUNTS:
+        return {}
+    return {
+        col: st.column_config.NumberColumn(col, help="概数（HyperLogLog 推定）")
+        for col in ND_COUNT_COLUMNS
+        if col in columns
+    }
+
+
 def get_safe_float(row: pd.Series, key: str) -> float:
     val = row.get(key)
     return float(val) if val is not None and not pd.isna(val) else 0.0
@@ -148,10 +375,68 @@ def get_nullable_float(row: pd.Series, key: str) -> Optional[float]:
         return None
 
 
-def normalize_product_display_name(name: Any) -> str:
-    if pd.isna(name):
-        return ""
-    return str(name).strip()
+def normalize_product_display_names(names: pd.Series) -> pd.Series:
+    # 欠損は空文字、前後の空白は除去（列単位でまとめて処理）
+    return names.fillna("").astype(str).str.strip()
+
+
+def iter_customer_frames(df: pd.DataFrame, codes: List[str]) -> Iterable[Tuple[str, pd.DataFrame]]:
+    # 選択した得意先は行が無くても空フレームで返す（呼び出し側で「データなし」を得意先ごとに出す）
+    if "customer_code" not in df.columns:
+        df = df.assign(customer_code=pd.Series(dtype="string"))
+    groups = {str(k): g.drop(columns="customer_code") for k, g in df.groupby("customer_code", sort=False)}
+    empty = df.drop(columns="customer_code").iloc[0:0]
+    for code in codes:
+        yield code, groups.get(code, empty)
+
+
+def _safe_fill_for_display(
+    df: pd.DataFrame,
+    money_cols: List[str],
+    text_cols: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    # 浅いコピーのうえ、欠損を含む列だけを置き換える（全セル走査・深いコピーを避ける）
+    # 金額は円単位の整数に丸め、収まる場合は int32 まで縮める（表示は ¥{:,.0f} のため見た目は不変）
+    df = df.copy(deep=False)
+    for c0 in money_cols:
+        if c0 not in df.columns:
+            continue
+        s0 = df[c0]
+        if not pd.api.types.is_numeric_dtype(s0) or s0.isna().any():
+            s0 = pd.to_numeric(s0, errors="coerce").fillna(0)
+        vals = s0.to_numpy(dtype=np.float64)
+        if np.isfinite(vals).all():
+            fits_int32 = vals.size == 0 or np.abs(vals).max() <= np.iinfo(np.int32).max
+            s0 = pd.Series(np.rint(vals).astype(np.int32 if fits_int32 else np.int64), index=s0.index)
+        df[c0] = s0
+    if text_cols is None:
+        text_cols = df.select_dtypes(include=["object", "string"]).columns.difference(money_cols)
+    text_cols = [c0 for c0 in text_cols if c0 in df.columns]
+    if text_cols:
+        has_na = df[text_cols].isna().any()
+        na_cols = has_na.index[has_na.to_numpy()].tolist()
+        if na_cols:
+            df[na_cols] = df[na_cols].fillna("")
+    return df
+
+
+_RANK_ICONS_BEST = ("🥇 1位", "🥈 2位", "🥉 3位")
+_RANK_ICONS_WORST = ("🚨 1位", "⚠️ 2位", "⚡ 3位")
+
+
+_RANK_ICON_CACHE: Dict[str, List[str]] = {}
+
+
+def rank_icons(n: int, mode: str) -> List[str]:
+    # 上位3件は固定ラベル、4位以降は書式で生成。生成済みのラベルはモードごとに保持し、以降はスライスのみ
+    key = "ベスト" if mode == "ベスト" else "ワースト"
+    labels = _RANK_ICON_CACHE.get(key) or list(_RANK_ICONS_BEST if key == "ベスト" else _RANK_ICONS_WORST)
+    if len(labels) < n:
+        # セッション（スレッド）間で共有するため、既存リストは変更せず差し替える
+        tail_fmt = "🌟 {}位" if key == "ベスト" else "📉 {}位"
+        labels = labels + [tail_fmt.format(i + 1) for i in range(len(labels), n)]
+        _RANK_ICON_CACHE[key] = labels
+    return labels[:n]
 
 
 def normalize_text(v: Any) -> str:
@@ -247,11 +532,37 @@ def sql_int_expr(colmap: Dict[str, str], key: str) -> str:
     return "CAST(NULL AS INT64)"
 
 
+def sql_yj_key_expr(colmap: Dict[str, str]) -> str:
+    # 成分キー: YJ コード（空・'0' は欠損扱い）→ 商品名。ランキング・ドリル・絞り込みで同じ式を使う
+    yj_col = colmap.get("yj_code", "yj_code")
+    name_col = colmap.get("product_name", "product_name")
+    return (
+        f"COALESCE(NULLIF(NULLIF(TRIM(CAST({yj_col} AS STRING)), ''), '0'), "
+        f"TRIM(CAST({name_col} AS STRING)))"
+    )
+
+
+def jst_today() -> date:
+    return datetime.now(APP_TZ).date()
+
+
+def current_fiscal_year(today: Optional[date] = None) -> int:
+    # 4月始まり。SQL 側の current_fy と同じ定義をクエリパラメータ（定数）として渡すためのもの
+    today = today or jst_today()
+    return today.year - (1 if today.month < 4 else 0)
+
+
+def date_params(today: Optional[date] = None) -> Dict[str, Any]:
+    # @today / @current_fy（同じ基準日から求める）
+    today = today or jst_today()
+    return {"today": today, "current_fy": current_fiscal_year(today)}
+
+
 # -----------------------------
 # 3. BigQuery Connection & Auth
 # -----------------------------
 @st.cache_resource
-def setup_bigquery_client() -> bigquery.Client:
+def setup_credentials() -> service_account.Credentials:
     bq = st.secrets["bigquery"]
     sa_info = dict(bq["service_account"])
     scopes = [
@@ -259,14 +570,45 @@ def setup_bigquery_client() -> bigquery.Client:
         "https://www.googleapis.com/auth/drive",
         "https://www.googleapis.com/auth/spreadsheets",
     ]
-    creds = service_account.Credentials.from_service_account_info(sa_info, scopes=scopes)
+    return service_account.Credentials.from_service_account_info(sa_info, scopes=scopes)
+
+
+@st.cache_resource
+def setup_bigquery_client() -> bigquery.Client:
     return bigquery.Client(
         project=PROJECT_DEFAULT,
-        credentials=creds,
+        credentials=setup_credentials(),
         location=DEFAULT_LOCATION,
     )
 
 
+@st.cache_resource
+def setup_bqstorage_client() -> Optional[Any]:
+    # Storage API の gRPC チャネルはプロセス内で1つを使い回す（読み込みごとに作らせない）
+    if not BQSTORAGE_AVAILABLE:
+        return None
+    from google.cloud import bigquery_storage
+
+    return bigquery_storage.BigQueryReadClient(credentials=setup_credentials())
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+# 型の完全一致で引く（bool は int のサブクラスだが type() は別なので取り違えない）
+_SCALAR_PARAM_TYPES: Dict[type, Tuple[str, Callable[[Any], Any]]] = {
+    str: ("STRING", _identity),
+    bool: ("BOOL", _identity),
+    int: ("INT64", _identity),
+    np.int64: ("INT64", int),
+    float: ("FLOAT64", _identity),
+    np.float64: ("FLOAT64", float),
+    pd.Timestamp: ("TIMESTAMP", pd.Timestamp.to_pydatetime),
+    date: ("DATE", _identity),
+}
+
+
 def _build_query_parameter(key: str, value: Any) -> bigquery.QueryParameter:
     if isinstance(value, tuple) and len(value) == 2:
         p_type, p_value = value
@@ -278,41 +620,201 @@ def _build_query_parameter(key: str, value: Any) -> bigquery.QueryParameter:
     if isinstance(value, (list, tuple)):
         return bigquery.ArrayQueryParameter(key, "STRING", [None if v is None else str(v) for v in value])
 
+    spec = _SCALAR_PARAM_TYPES.get(type(value))
+    if spec is not None:
+        p_type, convert = spec
+        return bigquery.ScalarQueryParameter(key, p_type, convert(value))
     if value is None:
         return bigquery.ScalarQueryParameter(key, "STRING", None)
-    if isinstance(value, bool):
-        return bigquery.ScalarQueryParameter(key, "BOOL", value)
-    if isinstance(value, int):
-        return bigquery.ScalarQueryParameter(key, "INT64", value)
-    if isinstance(value, float):
-        return bigquery.ScalarQueryParameter(key, "FLOAT64", value)
-    if isinstance(value, pd.Timestamp):
-        return bigquery.ScalarQueryParameter(key, "TIMESTAMP", value.to_pydatetime())
 
     return bigquery.ScalarQueryParameter(key, "STRING", str(value))
 
 
+def _job_label_value(label: str) -> str:
+    # ジョブラベルは小文字英数・_・- のみ、63文字まで（画面ごとのコスト集計用）
+    return _JOB_LABEL_INVALID_RE.sub("_", label.lower()).strip("_")[:63]
+
+
+def _build_job_config(params: Optional[Dict[str, Any]], label: str = "") -> bigquery.QueryJobConfig:
+    job_config = bigquery.QueryJobConfig(
+        use_query_cache=True,
+        maximum_bytes_billed=MAX_BYTES_BILLED,
+        priority=bigquery.QueryPriority.INTERACTIVE,
+    )
+    section = _job_label_value(label)
+    if section:
+        job_config.labels = {"section": section}
+    if params:
+        job_config.query_parameters = [_build_query_parameter(k, v) for k, v in params.items()]
+    return job_config
+
+
+def _small_limit_rows(sql: str) -> Optional[int]:
+    m = _TRAILING_LIMIT_RE.search(sql)
+    if m and int(m.group(1)) <= SMALL_LIMIT_MAX_ROWS:
+        return int(m.group(1))
+    return None
+
+
+def bqstorage_enabled() -> bool:
+    # サイドバーの「高速読込」（セッションごとの設定）。キャッシュ関数の中では読まず、引数で渡してキーに含める
+    return BQSTORAGE_AVAILABLE and bool(st.session_state.get("use_bqstorage", True))
+
+
+def _job_to_dataframe(
+    job: bigquery.QueryJob,
+    timeout_sec: int,
+    max_rows: Optional[int],
+    min_rows_for_storage: int,
+    use_bqstorage: bool,
+    arrow_strings: bool = False,
+) -> pd.DataFrame:
+    rows = job.result(timeout=timeout_sec, max_results=max_rows, page_size=max_rows)
+    # 行数が少ない結果は REST の方が速い（gRPC チャネル生成コストの方が大きい）
+    if max_rows is not None or (rows.total_rows is not None and rows.total_rows < min_rows_for_storage):
+        return rows.to_dataframe(
+            create_bqstorage_client=False,
+            string_dtype=ARROW_STRING_DTYPE if arrow_strings else None,
+        )
+    # 大きい結果は列ごとに別ブロックで変換し、変換済みの Arrow バッファを順に解放する（変換時のピークメモリを抑える）
+    table = rows.to_arrow(
+        bqstorage_client=setup_bqstorage_client() if use_bqstorage else None,
+        create_bqstorage_client=False,
+    )
+    return table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=_arrow_types_for(table, arrow_strings).get)
+
+
+def _arrow_types_for(table: pa.Table, arrow_strings: bool) -> Dict[pa.DataType, Any]:
+    types = _ARROW_TYPES_WITH_STRINGS if arrow_strings else _ARROW_TYPES
+    for col in table.columns:
+        if not pa.types.is_date(col.type) or col.null_count == len(col):
+            continue
+        bounds = pc.min_max(col)
+        if bounds["min"].as_py() < _NS_DATE_MIN or bounds["max"].as_py() > _NS_DATE_MAX:
+            return {k: v for k, v in types.items() if not pa.types.is_date(k)}
+    return types
+
+
 def query_df_safe(
     client: bigquery.Client,
     sql: str,
     params: Optional[Dict[str, Any]] = None,
     label: str = "",
     timeout_sec: int = 60,
+    max_rows: Optional[int] = None,
+    fast: bool = False,
+    min_rows_for_storage: int = BQSTORAGE_MIN_ROWS,
+    arrow_strings: bool = False,
 ) -> pd.DataFrame:
-    use_bqstorage = st.session_state.get("use_bqstorage", True)
     try:
-        job_config = bigquery.QueryJobConfig()
-        if params:
-            job_config.query_parameters = [_build_query_parameter(k, v) for k, v in params.items()]
+        job_config = _build_job_config(params, label)
+
+        # 末尾 LIMIT が小さいクエリは先頭ページだけで完結するので Storage API を使わない
+        if max_rows is None:
+            max_rows = _small_limit_rows(sql)
+
+        # メタデータ等の小さいクエリは jobs.query 経由で同期取得（jobs.insert + ポーリングを省略）
+        if fast:
+            rows = client.query_and_wait(sql, job_config=job_config, wait_timeout=timeout_sec, max_results=max_rows)
+            return rows.to_dataframe(create_bqstorage_client=False)
 
         job = client.query(sql, job_config=job_config)
-        job.result(timeout=timeout_sec)
-        return job.to_dataframe(create_bqstorage_client=use_bqstorage)
+        return _job_to_dataframe(job, timeout_sec, max_rows, min_rows_for_storage, bqstorage_enabled(), arrow_strings)
     except Exception as e:
         st.error(f"クエリエラー ({label}):\n{e}")
         return pd.DataFrame()
 
 
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+def _query_df_cached(
+    _client: bigquery.Client,
+    sql: str,
+    params: Optional[Dict[str, Any]],
+    arrow_strings: bool,
+    use_bqstorage: bool,
+    label: str = "",
+) -> pd.DataFrame:
+    # 失敗時は例外のまま抜ける（空の結果をキャッシュしない）
+    job = _client.query(sql, job_config=_build_job_config(params, label))
+    return _job_to_dataframe(job, 60, _small_limit_rows(sql), BQSTORAGE_MIN_ROWS, use_bqstorage, arrow_strings)
+
+
+def query_df_cached(
+    client: bigquery.Client,
+    sql: str,
+    params: Optional[Dict[str, Any]] = None,
+    label: str = "",
+    arrow_strings: bool = False,
+) -> pd.DataFrame:
+    # 再実行ごとに同じ SQL / パラメータで引き直す表示用クエリ向け（SQL 文字列とパラメータがキャッシュキー）。
+    # cache_resource はヒット時に pickle を経由しないので、共有オブジェクトを汚さないよう浅いコピーで返す
+    try:
+        return _query_df_cached(client, sql, params, arrow_strings, bqstorage_enabled(), label).copy(deep=False)
+    except Exception as e:
+        st.error(f"クエリエラー ({label}):\n{e}")
+        return pd.DataFrame()
+
+
+def submit_query(
+    client: bigquery.Client,
+    sql: str,
+    params: Optional[Dict[str, Any]] = None,
+    label: str = "",
+) -> Optional[bigquery.QueryJob]:
+    # 投入のみ（完了は待たない）。結果は collect_query で回収する
+    try:
+        return client.query(sql, job_config=_build_job_config(params, label))
+    except Exception as e:
+        st.error(f"クエリエラー ({label}):\n{e}")
+        return None
+
+
+def collect_query(
+    job: Optional[bigquery.QueryJob],
+    sql: str,
+    label: str = "",
+    timeout_sec: int = 60,
+    arrow_strings: bool = False,
+) -> pd.DataFrame:
+    if job is None:
+        return pd.DataFrame()
+    try:
+        return _job_to_dataframe(
+            job, timeout_sec, _small_limit_rows(sql), BQSTORAGE_MIN_ROWS, bqstorage_enabled(), arrow_strings
+        )
+    except Exception as e:
+        st.error(f"クエリエラー ({label}):\n{e}")
+        return pd.DataFrame()
+
+
+@st.cache_resource(ttl=600, max_entries=32, show_spinner=False)
+def _query_dfs_cached(
+    _client: bigquery.Client,
+    queries: Tuple[Tuple[str, str, Optional[Dict[str, Any]], str], ...],
+    use_bqstorage: bool,
+) -> Dict[str, pd.DataFrame]:
+    # 全ジョブを先に投入してから順に回収する。失敗時は例外のまま抜ける（空の結果をキャッシュしない）
+    jobs = {key: _client.query(sql, job_config=_build_job_config(params, label)) for key, sql, params, label in queries}
+    return {
+        key: _job_to_dataframe(jobs[key], 60, _small_limit_rows(sql), BQSTORAGE_MIN_ROWS, use_bqstorage)
+        for key, sql, _params, _label in queries
+    }
+
+
+def query_dfs_cached(
+    client: bigquery.Client,
+    queries: Dict[str, Tuple[str, Optional[Dict[str, Any]], str]],
+) -> Dict[str, pd.DataFrame]:
+    # 同じ画面で並べて出す、互いに独立な表示用クエリをまとめて投入・回収する（結果は組ごとにキャッシュ）
+    packed = tuple((key, sql, params, label) for key, (sql, params, label) in queries.items())
+    try:
+        return {key: df.copy(deep=False) for key, df in _query_dfs_cached(client, packed, bqstorage_enabled()).items()}
+    except Exception as e:
+        labels = ", ".join(label for _sql, _params, label in queries.values())
+        st.error(f"クエリエラー ({labels}):\n{e}")
+        return {key: pd.DataFrame() for key in queries}
+
+
 @dataclass(frozen=True)
 class RoleInfo:
     is_authenticated: bool = False
@@ -348,38 +850,58 @@ def _split_table_fqn(table_fqn: str) -> Tuple[str, str, str]:
     return parts[0], parts[1], parts[2]
 
 
-@st.cache_data(ttl=3600)
 def role_table_has_login_code(_client: bigquery.Client) -> bool:
-    project_id, dataset_id, table_name = _split_table_fqn(VIEW_ROLE_CLEAN)
-    sql = f"""
-        SELECT 1
-        FROM `{project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS`
-        WHERE table_name = @table_name
-          AND column_name = 'login_code'
-        LIMIT 1
-    """
-    df = query_df_safe(_client, sql, {"table_name": table_name}, "Role Schema Check")
-    return not df.empty
+    return "login_code" in get_view_columns(_client, VIEW_ROLE_CLEAN)
 
 
 # -----------------------------
 # ★ ColMap汎用（任意VIEWの列名揺れ吸収）
 # -----------------------------
-@st.cache_data(ttl=3600)
-def get_view_columns(_client: bigquery.Client, view_fqn: str) -> set[str]:
-    project_id, dataset_id, table_name = _split_table_fqn(view_fqn)
-    sql = f"""
-        SELECT column_name
+@st.cache_resource(ttl=3600, show_spinner=False)
+def _resolve_all_schemas(_client: bigquery.Client, view_fqns: Tuple[str, ...]) -> Mapping[str, frozenset[str]]:
+    # データセットごとの INFORMATION_SCHEMA を UNION ALL でまとめ、1クエリで全VIEWの列を取得。
+    # 列名は BigQuery 側で VIEW 単位の配列に畳んで返す（行数 = VIEW 数）
+    by_dataset: Dict[Tuple[str, str], List[str]] = {}
+    for fqn in view_fqns:
+        project_id, dataset_id, table_name = _split_table_fqn(fqn)
+        by_dataset.setdefault((project_id, dataset_id), []).append(table_name)
+
+    selects = []
+    params: Dict[str, Any] = {}
+    for i, ((project_id, dataset_id), table_names) in enumerate(by_dataset.items()):
+        params[f"table_names_{i}"] = table_names
+        selects.append(
+            f"""
+        SELECT '{project_id}.{dataset_id}.' || table_name AS view_fqn, ARRAY_AGG(LOWER(column_name) IGNORE NULLS) AS columns
         FROM `{project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS`
-        WHERE table_name = @table_name
-    """
-    df = query_df_safe(_client, sql, {"table_name": table_name}, f"Schema Check: {view_fqn}")
-    if df.empty or "column_name" not in df.columns:
-        return set()
-    return {str(c).lower() for c in df["column_name"].dropna().tolist()}
+        WHERE table_name IN UNNEST(@table_names_{i})
+        GROUP BY table_name"""
+        )
+    sql = "\n        UNION ALL".join(selects)
+    rows = _client.query_and_wait(sql, job_config=_build_job_config(params, "Schema Check"), wait_timeout=60)
 
+    schemas: Dict[str, frozenset[str]] = {fqn: frozenset() for fqn in view_fqns}
+    for row in rows:
+        schemas[row["view_fqn"]] = frozenset(row["columns"] or ())
+    # 共有オブジェクトなので読み取り専用で返す
+    return MappingProxyType(schemas)
+
+
+def resolve_all_schemas(_client: bigquery.Client, view_fqns: Tuple[str, ...]) -> Mapping[str, frozenset[str]]:
+    # 取得失敗は空の列構成として扱う（キャッシュはしないので次回の再実行で再取得する）
+    try:
+        return _resolve_all_schemas(_client, tuple(view_fqns))
+    except Exception as e:
+        st.error(f"クエリエラー (Schema Check):\n{e}")
+        return {fqn: frozenset() for fqn in view_fqns}
 
-def _pick_from(cols: set[str], *cands: str) -> Optional[str]:
+
+def get_view_columns(_client: bigquery.Client, view_fqn: str) -> frozenset[str]:
+    views = SCHEMA_PROBE_VIEWS if view_fqn in SCHEMA_PROBE_VIEWS else (view_fqn,)
+    return resolve_all_schemas(_client, views).get(view_fqn, frozenset())
+
+
+def _pick_from(cols: frozenset[str], *cands: str) -> Optional[str]:
     for c_ in cands:
         if c_ and c_.lower() in cols:
             return c_.lower()
@@ -416,19 +938,35 @@ def c(colmap: Dict[str, str], key: str) -> str:
     return colmap.get(key, key)
 
 
+def fy_window_sql(colmap: Dict[str, str]) -> str:
+    # 前期＋今期（@current_fy 必須）。sales_date の下限も併記し、日付パーティションの枝刈りを効かせる
+    return (
+        f"{c(colmap,'fiscal_year')} BETWEEN @current_fy - 1 AND @current_fy"
+        f" AND {c(colmap,'sales_date')} >= DATE(@current_fy - 1, 4, 1)"
+    )
+
+
+def sql_count_distinct(expr: str) -> str:
+    return f"APPROX_COUNT_DISTINCT({expr})" if USE_APPROX_COUNTS else f"COUNT(DISTINCT {expr})"
+
+
+def nd_window_sql(nd_colmap: Dict[str, str], alias: str = "nd") -> str:
+    # 初回納品日の直近 @days 日（@today / @days 必須）。上限も閉じて、パーティションの枝刈り範囲を確定させる。
+    # 日数はパラメータで渡し、スライダー位置が変わっても SQL 文字列は同じに保つ
+    fsd = f"{alias}.{c(nd_colmap,'first_sales_date')}"
+    return f"{fsd} BETWEEN DATE_SUB({SQL_TODAY}, INTERVAL @days DAY) AND {SQL_TODAY}"
+
+
 # -----------------------------
 # VIEW_UNIFIED系
 # -----------------------------
-@st.cache_data(ttl=3600)
-def get_unified_columns(_client: bigquery.Client) -> set[str]:
+def get_unified_columns(_client: bigquery.Client) -> frozenset[str]:
+    # 列構成は resolve_all_schemas（cache_resource）が保持しているので、ここで重ねてキャッシュしない
     return get_view_columns(_client, VIEW_UNIFIED)
 
 
-def get_available_customer_group_columns(_client: bigquery.Client) -> list[str]:
-    columns = get_unified_columns(_client)
-    return [col for col in CUSTOMER_GROUP_COLUMN_CANDIDATES if col in columns]
-
-
+# 戻り値は不変（文字列のタプル）なので cache_resource で共有し、再実行ごとの pickle 復元を省く
+@st.cache_resource(ttl=3600, show_spinner=False)
 def resolve_customer_group_sql_expr(_client: bigquery.Client) -> Tuple[Optional[str], Optional[str]]:
     cols = get_unified_columns(_client)
 
@@ -473,6 +1011,42 @@ def resolve_customer_group_sql_expr(_client: bigquery.Client) -> Tuple[Optional[
     return None, None
 
 
+@st.cache_resource(ttl=3600, show_spinner=False)
+def build_customer_dim_sql(_client: bigquery.Client, colmap: Dict[str, str]) -> str:
+    # 日次スナップショット（dim_customer_snapshot）があればそれを読む。無ければ VIEW_UNIFIED を集約
+    if {"customer_code", "customer_name", "group_name"} <= get_view_columns(_client, TABLE_CUSTOMER_DIM):
+        return f"""
+          SELECT customer_code, customer_name, group_name
+          FROM `{TABLE_CUSTOMER_DIM}`
+        """
+
+    group_expr, _ = resolve_customer_group_sql_expr(_client)
+    return f"""
+          SELECT
+            CAST({c(colmap,'customer_code')} AS STRING) AS customer_code,
+            ANY_VALUE(CAST({c(colmap,'customer_name')} AS STRING)) AS customer_name,
+            ANY_VALUE({group_expr or "'未設定'"}) AS group_name
+          FROM `{VIEW_UNIFIED}`
+          GROUP BY customer_code
+        """
+
+
+@st.cache_resource(ttl=3600, show_spinner=False)
+def _fetch_customer_dim(_client: bigquery.Client, cust_dim_sql: str, use_bqstorage: bool) -> pd.DataFrame:
+    # 失敗時は例外のまま抜ける（空の結果をキャッシュしない）
+    job = _client.query(cust_dim_sql, job_config=_build_job_config(None, "Customer Dim"))
+    return _job_to_dataframe(job, 60, _small_limit_rows(cust_dim_sql), BQSTORAGE_MIN_ROWS, use_bqstorage)
+
+
+def fetch_customer_dim(client: bigquery.Client, cust_dim_sql: str) -> pd.DataFrame:
+    # 得意先マスタは大きくなり得るので、pickle を経由しない cache_resource で共有し浅いコピーで返す
+    try:
+        return _fetch_customer_dim(client, cust_dim_sql, bqstorage_enabled()).copy(deep=False)
+    except Exception as e:
+        st.error(f"クエリエラー (Customer Dim):\n{e}")
+        return pd.DataFrame()
+
+
 # -----------------------------
 # ★ ColMap（列名吸収）: VIEW_UNIFIED
 # -----------------------------
@@ -534,9 +1108,82 @@ def resolve_new_delivery_colmap(_client: bigquery.Client) -> Dict[str, str]:
     return resolve_view_colmap(_client, VIEW_NEW_DELIVERY, mapping, required, optional)
 
 
+def resolve_new_delivery_source(_client: bigquery.Client, nd_colmap: Dict[str, str]) -> Tuple[str, Dict[str, str]]:
+    # 日次サマリー（nd_daily_summary）があれば、その列名をそのまま ColMap として使う。無ければ VIEW_NEW_DELIVERY
+    if set(ND_DAILY_COLUMNS) <= get_view_columns(_client, TABLE_ND_DAILY):
+        return TABLE_ND_DAILY, {k: k for k in ND_DAILY_COLUMNS}
+    return VIEW_NEW_DELIVERY, nd_colmap
+
+
+def nd_string_expr(nd_table: str, nd_colmap: Dict[str, str], key: str, alias: str = "nd") -> str:
+    # nd_daily_summary はコード・名称を STRING で持つので、そのまま結合・集計する（VIEW を読むときだけ CAST）
+    col = f"{alias}.{c(nd_colmap, key)}" if alias else c(nd_colmap, key)
+    return col if nd_table == TABLE_ND_DAILY else f"CAST({col} AS STRING)"
+
+
+# -----------------------------
+# ★ 起動時メタデータ（スキーマ・ColMap・権限）
+# -----------------------------
+@dataclass(frozen=True)
+class Bootstrap:
+    role: RoleInfo
+    unified_colmap: Dict[str, str]
+    nd_colmap: Dict[str, str]
+
+
+def bootstrap_metadata(client: bigquery.Client, login_email: str, login_code: str) -> Bootstrap:
+    # 全VIEWの列構成を1クエリで先に確定させ、ColMap 2種と login_code 有無はそこから導出する。
+    # 権限クエリは login_code 有無に依存するため、この後に1回だけ（セッション内キャッシュ付き）実行する。
+    # ログイン済みセッションは Bootstrap ごと保持し、再実行時は cache_data のキー計算も省く
+    digest = _credential_digest(login_email, login_code)
+    cached_boot = st.session_state.get("bootstrap_cache")
+    if cached_boot is not None and hmac.compare_digest(st.session_state.get("bootstrap_cache_key", ""), digest):
+        return cached_boot
+
+    resolve_all_schemas(client, SCHEMA_PROBE_VIEWS)
+    boot = Bootstrap(
+        role=resolve_role_cached(client, login_email, login_code),
+        unified_colmap=resolve_unified_colmap(client),
+        nd_colmap=resolve_new_delivery_colmap(client),
+    )
+    if boot.role.is_authenticated and not boot.unified_colmap.get("_missing_required"):
+        st.session_state["bootstrap_cache_key"] = digest
+        st.session_state["bootstrap_cache"] = boot
+    return boot
+
+
 # -----------------------------
 # スコープ設定
 # -----------------------------
+@st.cache_data(ttl=21600, show_spinner=False)
+def fetch_scope_group_options(
+    _client: bigquery.Client,
+    group_expr: str,
+    login_email_col: str,
+    login_email: Optional[str],
+) -> List[str]:
+    # グループ候補はほぼ変わらないので 6 時間保持（login_email=None は全社）。失敗は例外のまま抜けてキャッシュしない
+    role_where = ""
+    params: Dict[str, Any] = {}
+    if login_email is not None:
+        role_where = f"WHERE {login_email_col} = @login_email"
+        params["login_email"] = login_email
+    sql = f"""
+        SELECT group_name
+        FROM (
+          SELECT {group_expr} AS group_name
+          FROM `{VIEW_UNIFIED}`
+          {role_where}
+          GROUP BY group_name
+        )
+        ORDER BY group_name
+        LIMIT 500
+    """
+    job_config = _build_job_config(params, "Scope Group Options")
+    rows = _client.query_and_wait(sql, job_config=job_config, wait_timeout=60)
+    return [row["group_name"] for row in rows]
+
+
 def render_scope_filters(client: bigquery.Client, role: RoleInfo, colmap: Dict[str, str]) -> ScopeFilter:
     st.markdown("### 🔍 分析スコープ設定")
     predicates: list[str] = []
@@ -547,21 +1194,18 @@ def render_scope_filters(client: bigquery.Client, role: RoleInfo, colmap: Dict[s
 
         group_expr, group_src = resolve_customer_group_sql_expr(client)
         if group_expr:
-            role_where = ""
-            role_params: Dict[str, Any] = {}
-            if not role.role_admin_view:
-                role_where = f"WHERE {c(colmap,'login_email')} = @login_email"
-                role_params["login_email"] = role.login_email
-
-            sql_group = f"""
-                SELECT DISTINCT {group_expr} AS group_name
-                FROM `{VIEW_UNIFIED}`
-                {role_where}
-                ORDER BY group_name
-                LIMIT 500
-            """
-            df_group = query_df_safe(client, sql_group, role_params, "Scope Group Options")
-            group_opts = ["指定なし"] + (df_group["group_name"].tolist() if not df_group.empty else [])
+            # expanded=False でも中身は毎回実行されるため、候補の取得はボタン押下後に限定
+            if not st.session_state.get("scope_group_opts_loaded"):
+                if c1_.button("グループ候補を読み込む", key="btn_scope_group_opts"):
+                    st.session_state.scope_group_opts_loaded = True
+
+            group_opts = ["指定なし"]
+            if st.session_state.get("scope_group_opts_loaded"):
+                scope_login = None if role.role_admin_view else role.login_email
+                try:
+                    group_opts += fetch_scope_group_options(client, group_expr, c(colmap, "login_email"), scope_login)
+                except Exception as e:
+                    st.error(f"クエリエラー (Scope Group Options):\n{e}")
             selected_group = c1_.selectbox("得意先グループ", options=group_opts)
             if selected_group != "指定なし":
                 predicates.append(f"{group_expr} = @scope_group")
@@ -604,13 +1248,13 @@ def resolve_role(client: bigquery.Client, login_email: str, login_code: str) ->
         """
         params = {"login_email": login_email}
 
-    df = query_df_safe(client, sql, params, "Auth Check")
+    df = query_df_safe(client, sql, params, "Auth Check", fast=True)
     if df.empty:
         return RoleInfo(login_email=login_email)
 
     row = df.iloc[0]
     raw_role = str(row["role_tier"]).strip().upper()
-    is_admin = any(x in raw_role for x in ["ADMIN", "MANAGER", "HQ"])
+    is_admin = _ADMIN_ROLE_RE.search(raw_role) is not None
 
     return RoleInfo(
         is_authenticated=True,
@@ -622,49 +1266,96 @@ def resolve_role(client: bigquery.Client, login_email: str, login_code: str) ->
     )
 
 
+def _credential_digest(login_email: str, login_code: str) -> str:
+    return hashlib.blake2b(f"{login_email}|{login_code}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def resolve_role_cached(client: bigquery.Client, login_email: str, login_code: str) -> RoleInfo:
+    if not login_email or not login_code:
+        return RoleInfo()
+
+    # 同一セッション・同一資格情報なら再実行ごとの認証クエリを省略（成功時のみ保持）
+    digest = _credential_digest(login_email, login_code)
+    cached_role = st.session_state.get("role_cache_role")
+    if cached_role is not None and hmac.compare_digest(st.session_state.get("role_cache_key", ""), digest):
+        return cached_role
+
+    role = resolve_role(client, login_email, login_code)
+    if role.is_authenticated:
+        st.session_state["role_cache_key"] = digest
+        st.session_state["role_cache_role"] = role
+    return role
+
+
 # -----------------------------
 # 4. Summary Query Builder
 # -----------------------------
-def build_summary_sql(colmap: Dict[str, str], scoped_by_login: bool = False) -> str:
+def build_summary_sql(colmap: Dict[str, str], scopes: Tuple[str, ...] = ("ORG",)) -> str:
+    # colmap はセッション中ほぼ不変なので、列構成ごとに組み立て済み SQL を使い回す
+    return _build_summary_sql(tuple(sorted(colmap.items())), tuple(scopes))
+
+
+@lru_cache(maxsize=16)
+def _build_summary_sql(colmap_items: Tuple[Tuple[str, str], ...], scopes: Tuple[str, ...]) -> str:
+    # scopes: "ORG"（全社）/ "ME"（@login_email 担当分）。両方指定時は1回のスキャンで行を複製して集計する
+    colmap = dict(colmap_items)
     sales_date_col = c(colmap, "sales_date")
     fiscal_year_expr = sql_int_expr(colmap, "fiscal_year")
     sales_expr = sql_numeric_expr(colmap, "sales_amount")
     gp_expr = sql_numeric_expr(colmap, "gross_profit")
     dp_expr = sql_numeric_expr(colmap, "total_drug_price")
-    where_sql = f"WHERE {c(colmap,'login_email')} = @login_email" if scoped_by_login else ""
+    is_me = f"{c(colmap,'login_email')} = @login_email"
+    # 集計対象は今期・前期のみ（当月・前年同月・最新月もこの範囲に入る）。年度と日付の定数条件で先に絞る
+    fy_window = fy_window_sql(colmap)
+    if "ORG" in scopes and "ME" in scopes:
+        scope_join = f"CROSS JOIN UNNEST(IF({is_me}, ['ORG', 'ME'], ['ORG'])) AS scope"
+        where_sql = f"WHERE {fy_window}"
+    elif "ME" in scopes:
+        scope_join = "CROSS JOIN UNNEST(['ME']) AS scope"
+        where_sql = f"WHERE {is_me} AND {fy_window}"
+    else:
+        scope_join = "CROSS JOIN UNNEST(['ORG']) AS scope"
+        where_sql = f"WHERE {fy_window}"
+    scope_list = ", ".join(f"'{s_}'" for s_ in scopes)
 
     return f"""
         WITH base AS (
           SELECT
+            scope,
             CAST({sales_date_col} AS DATE) AS sales_date,
             {fiscal_year_expr} AS fiscal_year,
             {sales_expr} AS sales_amount,
             {gp_expr} AS gross_profit,
             {dp_expr} AS drug_price
           FROM `{VIEW_UNIFIED}`
+          {scope_join}
           {where_sql}
         ),
+        scopes AS (
+          SELECT scope FROM UNNEST([{scope_list}]) AS scope
+        ),
         meta AS (
           SELECT
+            s.scope,
             MAX(sales_date) AS max_sales_date,
             DATE_TRUNC(MAX(sales_date), MONTH) AS latest_loaded_month,
-            DATE_TRUNC(CURRENT_DATE('Asia/Tokyo'), MONTH) AS calendar_month,
-            DATE_TRUNC(DATE_SUB(CURRENT_DATE('Asia/Tokyo'), INTERVAL 1 YEAR), MONTH) AS py_calendar_month,
+            DATE_TRUNC({SQL_TODAY}, MONTH) AS calendar_month,
+            DATE_TRUNC(DATE_SUB({SQL_TODAY}, INTERVAL 1 YEAR), MONTH) AS py_calendar_month,
             DATE_SUB(MAX(sales_date), INTERVAL 1 YEAR) AS py_same_day,
-            (
-              EXTRACT(YEAR FROM CURRENT_DATE('Asia/Tokyo'))
-              - CASE WHEN EXTRACT(MONTH FROM CURRENT_DATE('Asia/Tokyo')) < 4 THEN 1 ELSE 0 END
-            ) AS current_fy,
+            @current_fy AS current_fy,
             CASE
               WHEN MAX(sales_date) IS NULL THEN NULL
               WHEN MAX(sales_date) = DATE_SUB(DATE_ADD(DATE_TRUNC(MAX(sales_date), MONTH), INTERVAL 1 MONTH), INTERVAL 1 DAY)
                 THEN DATE_TRUNC(MAX(sales_date), MONTH)
               ELSE DATE_SUB(DATE_TRUNC(MAX(sales_date), MONTH), INTERVAL 1 MONTH)
             END AS latest_closed_month
-          FROM base
+          FROM scopes s
+          LEFT JOIN base b USING (scope)
+          GROUP BY s.scope
         ),
         agg AS (
           SELECT
+            b.scope,
             COUNTIF(DATE_TRUNC(b.sales_date, MONTH) = m.calendar_month) AS calendar_month_rows,
 
             SUM(IF(DATE_TRUNC(b.sales_date, MONTH) = m.calendar_month, b.sales_amount, NULL)) AS calendar_month_sales,
@@ -698,9 +1389,11 @@ def build_summary_sql(colmap: Dict[str, str], scoped_by_login: bool = False) ->
             SUM(IF(b.fiscal_year = m.current_fy - 1, b.drug_price, 0)) AS drug_price_py_total,
             SUM(IF(b.fiscal_year = m.current_fy - 1 AND b.drug_price IS NOT NULL, b.sales_amount, NULL)) AS sales_with_dp_py_total
           FROM base b
-          CROSS JOIN meta m
+          JOIN meta m USING (scope)
+          GROUP BY b.scope
         )
         SELECT
+          m.scope,
           IFNULL(a.sales_amount_fytd, 0) AS sales_amount_fytd,
           IFNULL(a.gross_profit_fytd, 0) AS gross_profit_fytd,
           a.drug_price_fytd AS drug_price_fytd,
@@ -732,7 +1425,7 @@ def build_summary_sql(colmap: Dict[str, str], scoped_by_login: bool = False) ->
           a.latest_closed_month_profit,
           a.latest_closed_month_drug_price,
 
-          a.calendar_month_rows,
+          IFNULL(a.calendar_month_rows, 0) AS calendar_month_rows,
           m.max_sales_date,
           m.latest_loaded_month,
           m.latest_closed_month,
@@ -744,13 +1437,47 @@ def build_summary_sql(colmap: Dict[str, str], scoped_by_login: bool = False) ->
           END AS refresh_status,
           CASE
             WHEN m.max_sales_date IS NULL THEN NULL
-            ELSE DATE_DIFF(CURRENT_DATE('Asia/Tokyo'), m.max_sales_date, DAY)
+            ELSE DATE_DIFF({SQL_TODAY}, m.max_sales_date, DAY)
           END AS lag_days
         FROM meta m
-        CROSS JOIN agg a
+        LEFT JOIN agg a USING (scope)
     """
 
 
+@st.cache_data(ttl=FYTD_CACHE_TTL_SEC, show_spinner=False)
+def _fetch_fytd_summary(
+    _client: bigquery.Client,
+    scope: str,
+    login_email: str,
+    colmap: Dict[str, str],
+    as_of: date,
+) -> pd.DataFrame:
+    # as_of（JST の日付）はキャッシュキー兼 @today / @current_fy の値。日付が変わればキーも変わって引き直す
+    # 結果は1行なので jobs.query で同期取得し、Storage API も使わない
+    sql = build_summary_sql(colmap, (scope,))
+    params = date_params(as_of)
+    if scope == "ME":
+        params["login_email"] = login_email
+    job_config = _build_job_config(params, "FYTD Summary")
+    rows = _client.query_and_wait(sql, job_config=job_config, wait_timeout=60)
+    return rows.to_dataframe(create_bqstorage_client=False)
+
+
+def fetch_fytd_summary(
+    client: bigquery.Client,
+    scope: str,
+    login_email: str,
+    colmap: Dict[str, str],
+) -> pd.DataFrame:
+    # 年度累計は日次でしか変わらないので、日付ごとに FYTD_CACHE_TTL_SEC（1時間）保持（失敗は例外のまま抜けてキャッシュしない）。
+    # 全社（ORG）は担当者に依らないのでキーから login_email を外し、管理者間で1つの結果を共有する
+    try:
+        return _fetch_fytd_summary(client, scope, login_email if scope == "ME" else "", colmap, jst_today())
+    except Exception as e:
+        st.error(f"クエリエラー (FYTD Summary):\n{e}")
+        return pd.DataFrame()
+
+
 # -----------------------------
 # 5. UI Sections
 # -----------------------------
@@ -885,6 +1612,13 @@ def render_summary_metrics(row: pd.Series) -> None:
         st.caption("※ 総納入薬価列が VIEW_UNIFIED に存在しない、または数値化できないため、総納入薬価 / 納入価率は「—」表示です。")
 
 
+def pick_fytd_row(df_summary: pd.DataFrame, scope_tag: str) -> Optional[pd.Series]:
+    if df_summary.empty or "scope" not in df_summary.columns:
+        return None
+    hit = df_summary[df_summary["scope"] == scope_tag]
+    return None if hit.empty else hit.iloc[0]
+
+
 def render_fytd_org_section(client: bigquery.Client, colmap: Dict[str, str]) -> None:
     st.subheader("🏢 年度累計（FYTD）｜全社サマリー")
 
@@ -895,10 +1629,9 @@ def render_fytd_org_section(client: bigquery.Client, colmap: Dict[str, str]) ->
         st.session_state.org_data_loaded = True
 
     if st.session_state.get("org_data_loaded"):
-        sql = build_summary_sql(colmap, scoped_by_login=False)
-        df_org = query_df_safe(client, sql, None, "Org Summary")
-        if not df_org.empty:
-            render_summary_metrics(df_org.iloc[0])
+        row = pick_fytd_row(fetch_fytd_summary(client, "ORG", "", colmap), "ORG")
+        if row is not None:
+            render_summary_metrics(row)
         else:
             st.info("全社サマリーのデータが取得できませんでした。")
 
@@ -906,10 +1639,9 @@ def render_fytd_org_section(client: bigquery.Client, colmap: Dict[str, str]) ->
 def render_fytd_me_section(client: bigquery.Client, login_email: str, colmap: Dict[str, str]) -> None:
     st.subheader("👤 年度累計（FYTD）｜個人サマリー")
     if st.button("自分の成績を読み込む", key="btn_me_load"):
-        sql = build_summary_sql(colmap, scoped_by_login=True)
-        df_me = query_df_safe(client, sql, {"login_email": login_email}, "Me Summary")
-        if not df_me.empty:
-            render_summary_metrics(df_me.iloc[0])
+        row = pick_fytd_row(fetch_fytd_summary(client, "ME", login_email, colmap), "ME")
+        if row is not None:
+            render_summary_metrics(row)
         else:
             st.info("個人サマリーのデータが取得できませんでした。")
 
@@ -917,36 +1649,12 @@ def render_fytd_me_section(client: bigquery.Client, login_email: str, colmap: Di
 # -----------------------------
 # ★ メーカー別パフォーマンス
 # -----------------------------
-def render_manufacturer_performance_section(
-    client: bigquery.Client,
-    role: RoleInfo,
-    scope: ScopeFilter,
-    colmap: Dict[str, str],
-) -> None:
-    st.subheader("🏭 メーカー別パフォーマンス（前期 / 今期：売上・粗利・加重平均）")
-
-    manu_col = colmap.get("manufacturer")
-    dp_col = colmap.get("total_drug_price")
-    if not manu_col or not dp_col:
-        st.info("VIEW_UNIFIED にメーカー列または総薬価列が見つからないため、このセクションは表示できません。")
-        return
-
-    role_filter = "" if role.role_admin_view else f"{c(colmap,'login_email')} = @login_email"
-    scope_filter_clause = scope.where_clause()
-    where_sql = _compose_where(role_filter, scope_filter_clause)
-
-    params: Dict[str, Any] = dict(scope.params or {})
-    if not role.role_admin_view:
-        params["login_email"] = role.login_email
-
-    sql = f"""
-      WITH fy AS (
-        SELECT
-          (EXTRACT(YEAR FROM CURRENT_DATE('Asia/Tokyo'))
-            - CASE WHEN EXTRACT(MONTH FROM CURRENT_DATE('Asia/Tokyo')) < 4 THEN 1 ELSE 0 END) AS current_fy,
-          DATE_SUB(CURRENT_DATE('Asia/Tokyo'), INTERVAL 1 YEAR) AS py_today
-      ),
-      channel_map AS (
+def build_manufacturer_perf_sql(colmap: Dict[str, str], where_sql: str) -> str:
+    # メーカー列・総薬価列は呼び出し側で存在確認済み（colmap の manufacturer / total_drug_price）
+    manu_col = colmap["manufacturer"]
+    dp_col = colmap["total_drug_price"]
+    return f"""
+      WITH channel_map AS (
         SELECT original_maker, channel_maker
         FROM `salesdb-479915.sales_data.dim_maker_channel_map`
       ),
@@ -966,34 +1674,64 @@ def render_manufacturer_performance_section(
         LEFT JOIN channel_map cm
           ON cm.original_maker = TRIM(CAST({manu_col} AS STRING))
         {where_sql}
+      ),
+      agg AS (
+        SELECT
+          manufacturer,
+          SUM(CASE WHEN fiscal_year = @current_fy THEN sales_amount ELSE 0 END) AS ty_sales,
+          SUM(CASE WHEN fiscal_year = @current_fy - 1 AND sales_date <= {SQL_PY_TODAY} THEN sales_amount ELSE 0 END) AS py_sales,
+          SUM(CASE WHEN fiscal_year = @current_fy THEN gross_profit ELSE 0 END) AS ty_gp,
+          SUM(CASE WHEN fiscal_year = @current_fy - 1 AND sales_date <= {SQL_PY_TODAY} THEN gross_profit ELSE 0 END) AS py_gp,
+          SUM(CASE WHEN fiscal_year = @current_fy THEN drug_price ELSE 0 END) AS ty_dp
+        FROM base
+        GROUP BY manufacturer
+        HAVING ty_sales != 0 OR py_sales != 0
       )
       SELECT
-        manufacturer,
-        SUM(CASE WHEN fiscal_year = current_fy THEN sales_amount ELSE 0 END) AS ty_sales,
-        SUM(CASE WHEN fiscal_year = current_fy - 1 AND sales_date <= py_today THEN sales_amount ELSE 0 END) AS py_sales,
-        SUM(CASE WHEN fiscal_year = current_fy THEN gross_profit ELSE 0 END) AS ty_gp,
-        SUM(CASE WHEN fiscal_year = current_fy - 1 AND sales_date <= py_today THEN gross_profit ELSE 0 END) AS py_gp,
-        SUM(CASE WHEN fiscal_year = current_fy THEN drug_price ELSE 0 END) AS ty_dp
-      FROM base
-      CROSS JOIN fy
-      GROUP BY manufacturer
-      HAVING ty_sales != 0 OR py_sales != 0
+        *,
+        ty_sales - py_sales AS sales_diff,
+        ty_gp - py_gp AS gp_diff,
+        IFNULL((SAFE_DIVIDE(ty_sales, NULLIF(py_sales, 0)) - 1) * 100, 0) AS sales_growth,
+        IFNULL((SAFE_DIVIDE(ty_gp, NULLIF(py_gp, 0)) - 1) * 100, 0) AS gp_growth,
+        IF(ty_dp > 0, SAFE_DIVIDE(ty_sales, ty_dp) * 100, NULL) AS delivery_rate
+      FROM agg
       ORDER BY ty_sales DESC
       LIMIT 200
     """
+
+
+def render_manufacturer_performance_section(
+    client: bigquery.Client,
+    role: RoleInfo,
+    scope: ScopeFilter,
+    colmap: Dict[str, str],
+) -> None:
+    st.subheader("🏭 メーカー別パフォーマンス（前期 / 今期：売上・粗利・加重平均）")
+
+    manu_col = colmap.get("manufacturer")
+    dp_col = colmap.get("total_drug_price")
+    if not manu_col or not dp_col:
+        st.info("VIEW_UNIFIED にメーカー列または総薬価列が見つからないため、このセクションは表示できません。")
+        return
+
+    role_filter = "" if role.role_admin_view else f"{c(colmap,'login_email')} = @login_email"
+    scope_filter_clause = scope.where_clause()
+    where_sql = _compose_where(
+        role_filter, scope_filter_clause, fy_window_sql(colmap)
+    )
+
+    params: Dict[str, Any] = dict(scope.params or {})
+    if not role.role_admin_view:
+        params["login_email"] = role.login_email
+    params.update(date_params())
+
+    sql = build_manufacturer_perf_sql(colmap, where_sql)
     df = query_df_safe(client, sql, params, "Manufacturer Perf")
 
     if df.empty:
         st.info("該当データがありません。")
         return
 
-    df = df.copy()
-    df["売上差額"] = df["ty_sales"] - df["py_sales"]
-    df["粗利差額"] = df["ty_gp"] - df["py_gp"]
-    df["売上成長率"] = df.apply(lambda r: ((r["ty_sales"] / r["py_sales"] - 1) * 100) if r["py_sales"] else 0.0, axis=1)
-    df["粗利成長率"] = df.apply(lambda r: ((r["ty_gp"] / r["py_gp"] - 1) * 100) if r["py_gp"] else 0.0, axis=1)
-    df["納入価率(対薬価率)"] = df.apply(lambda r: (r["ty_sales"] / r["ty_dp"] * 100) if r["ty_dp"] and r["ty_dp"] > 0 else None, axis=1)
-
     c1_, c2_, c3_ = st.columns(3)
     sort_key = c1_.selectbox(
         "並び替え",
@@ -1004,18 +1742,17 @@ def render_manufacturer_performance_section(
     only_negative = c3_.checkbox("下落のみ（売上差額<0）", value=False)
 
     if only_negative:
-        df = df[df["売上差額"] < 0]
+        df = df[df["sales_diff"] < 0]
 
+    # 差額・成長率は SQL 側で算出済み（今期売上順は SQL の ORDER BY のまま）
     if sort_key == "売上差額（小→大）":
-        df = df.sort_values("売上差額", ascending=True)
+        df = df.sort_values("sales_diff", ascending=True)
     elif sort_key == "売上差額（大→小）":
-        df = df.sort_values("売上差額", ascending=False)
+        df = df.sort_values("sales_diff", ascending=False)
     elif sort_key == "粗利差額（小→大）":
-        df = df.sort_values("粗利差額", ascending=True)
+        df = df.sort_values("gp_diff", ascending=True)
     elif sort_key == "粗利差額（大→小）":
-        df = df.sort_values("粗利差額", ascending=False)
-    else:
-        df = df.sort_values("ty_sales", ascending=False)
+        df = df.sort_values("gp_diff", ascending=False)
 
     df = df.head(int(topn))
 
@@ -1027,33 +1764,78 @@ def render_manufacturer_performance_section(
             "ty_gp": "今期粗利",
             "py_gp": "前年同期粗利",
             "ty_dp": "今期総薬価",
+            "sales_diff": "売上差額",
+            "gp_diff": "粗利差額",
+            "sales_growth": "売上成長率",
+            "gp_growth": "粗利成長率",
+            "delivery_rate": "納入価率(対薬価率)",
         }
     )
 
+    money_cols = ["今期売上", "前年同期売上", "売上差額", "今期粗利", "前年同期粗利", "粗利差額", "今期総薬価"]
+    column_config = display_column_config(money_cols, pct_cols=["売上成長率"])
+    # 薬価の無いメーカーは率が NULL。数値のまま渡してブラウザ側の並べ替えを数値順に保ち、欠損はグリッドの欠損表示に任せる
+    df_disp["納入価率(対薬価率)"] = pd.to_numeric(df_disp["納入価率(対薬価率)"], errors="coerce")
+    column_config["納入価率(対薬価率)"] = st.column_config.NumberColumn(
+        "納入価率(対薬価率)", format="%.2f%%", help="総薬価が無いメーカーは — （値なし）"
+    )
     st.dataframe(
-        df_disp[
-            ["メーカー", "今期売上", "前年同期売上", "売上差額", "売上成長率", "今期粗利", "前年同期粗利", "粗利差額", "今期総薬価", "納入価率(対薬価率)"]
-        ].style.format(
-            {
-                "今期売上": "¥{:,.0f}",
-                "前年同期売上": "¥{:,.0f}",
-                "売上差額": "¥{:,.0f}",
-                "売上成長率": "{:,.1f}%",
-                "今期粗利": "¥{:,.0f}",
-                "前年同期粗利": "¥{:,.0f}",
-                "粗利差額": "¥{:,.0f}",
-                "今期総薬価": "¥{:,.0f}",
-                "納入価率(対薬価率)": lambda v: f"{v:,.2f}%" if v is not None else "—",
-            }
+        _safe_fill_for_display(
+            df_disp[
+                ["メーカー", "今期売上", "前年同期売上", "売上差額", "売上成長率", "今期粗利", "前年同期粗利", "粗利差額", "今期総薬価", "納入価率(対薬価率)"]
+            ],
+            money_cols,
+            text_cols=["メーカー"],
         ),
         use_container_width=True,
         hide_index=True,
+        column_config=column_config,
     )
 
 
 # -----------------------------
 # 得意先・グループ別パフォーマンス & 要因分析
 # -----------------------------
+def build_parent_drill_sql(colmap: Dict[str, str], filter_sql: str, sort_order: str) -> str:
+    # 同じ絞り込みなら毎回同一の SQL 文字列を返す（BigQuery の結果キャッシュは文字列一致が条件）
+    return _build_parent_drill_sql(tuple(sorted(colmap.items())), filter_sql, sort_order)
+
+
+@lru_cache(maxsize=64)
+def _build_parent_drill_sql(colmap_items: Tuple[Tuple[str, str], ...], filter_sql: str, sort_order: str) -> str:
+    colmap = dict(colmap_items)
+    return f"""
+        WITH base_raw AS (
+          SELECT
+            {sql_yj_key_expr(colmap)} AS yj_key,
+            CAST({c(colmap,'product_name')} AS STRING) AS product_base,
+            SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS ty_sales,
+            SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy - 1 AND {c(colmap,'sales_date')} <= {SQL_PY_TODAY} THEN {c(colmap,'sales_amount')} ELSE 0 END) AS py_sales
+          FROM `{VIEW_UNIFIED}`
+          {filter_sql}
+          GROUP BY yj_key, product_base
+        ),
+        base AS (
+          SELECT
+            yj_key AS yj_code,
+            ANY_VALUE(product_base HAVING MAX ty_sales) AS product_name,
+            SUM(ty_sales) AS ty_sales,
+            SUM(py_sales) AS py_sales
+          FROM base_raw
+          GROUP BY yj_code
+        )
+        SELECT
+          yj_code,
+          product_name,
+          ty_sales AS sales_amount,
+          py_sales AS py_sales_amount,
+          (ty_sales - py_sales) AS sales_diff_yoy
+        FROM base
+        WHERE ty_sales > 0 OR py_sales > 0
+        ORDER BY sales_diff_yoy {sort_order}
+    """
+
+
 def render_group_underperformance_section(
     client: bigquery.Client,
     role: RoleInfo,
@@ -1082,79 +1864,66 @@ def render_group_underperformance_section(
 
     role_filter = "" if role.role_admin_view else f"{c(colmap,'login_email')} = @login_email"
     scope_filter_clause = scope.where_clause()
-    filter_sql = _compose_where(role_filter, scope_filter_clause)
 
     params: Dict[str, Any] = dict(scope.params or {})
     if not role.role_admin_view:
         params["login_email"] = role.login_email
 
     if perf_view == "グループ別":
-        sql_parent = f"""
-            WITH fy AS (
-              SELECT
-                (EXTRACT(YEAR FROM CURRENT_DATE('Asia/Tokyo'))
-                 - CASE WHEN EXTRACT(MONTH FROM CURRENT_DATE('Asia/Tokyo')) < 4 THEN 1 ELSE 0 END) AS current_fy,
-                DATE_SUB(CURRENT_DATE('Asia/Tokyo'), INTERVAL 1 YEAR) AS py_today
-            )
-            SELECT
-              {group_expr} AS `名称`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 AND {c(colmap,'sales_date')} <= py_today THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前年同期売上`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'gross_profit')} ELSE 0 END) AS `今期粗利`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 AND {c(colmap,'sales_date')} <= py_today THEN {c(colmap,'gross_profit')} ELSE 0 END) AS `前年同期粗利`
-            FROM `{VIEW_UNIFIED}`
-            CROSS JOIN fy
-            {filter_sql}
-            GROUP BY `名称`
-            HAVING `前年同期売上` > 0 OR `今期売上` > 0
-            ORDER BY (`今期売上` - `前年同期売上`) {sort_order}
-            LIMIT 50
-        """
+        key_select = f"{group_expr} AS `名称`"
+        group_by = "`名称`"
         parent_key_col = "名称"
     else:
-        sql_parent = f"""
-            WITH fy AS (
-              SELECT
-                (EXTRACT(YEAR FROM CURRENT_DATE('Asia/Tokyo'))
-                 - CASE WHEN EXTRACT(MONTH FROM CURRENT_DATE('Asia/Tokyo')) < 4 THEN 1 ELSE 0 END) AS current_fy,
-                DATE_SUB(CURRENT_DATE('Asia/Tokyo'), INTERVAL 1 YEAR) AS py_today
-            )
-            SELECT
-              CAST({c(colmap,'customer_code')} AS STRING) AS `コード`,
-              ANY_VALUE(CAST({c(colmap,'customer_name')} AS STRING)) AS `名称`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 AND {c(colmap,'sales_date')} <= py_today THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前年同期売上`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'gross_profit')} ELSE 0 END) AS `今期粗利`,
-              SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 AND {c(colmap,'sales_date')} <= py_today THEN {c(colmap,'gross_profit')} ELSE 0 END) AS `前年同期粗利`
-            FROM `{VIEW_UNIFIED}`
-            CROSS JOIN fy
-            {filter_sql}
-            GROUP BY `コード`
-            HAVING `前年同期売上` > 0 OR `今期売上` > 0
-            ORDER BY (`今期売上` - `前年同期売上`) {sort_order}
-            LIMIT 50
-        """
+        key_select = (
+            f"CAST({c(colmap,'customer_code')} AS STRING) AS `コード`,\n"
+            f"              ANY_VALUE(CAST({c(colmap,'customer_name')} AS STRING)) AS `名称`"
+        )
+        group_by = "`コード`"
         parent_key_col = "コード"
 
-    df_parent = query_df_safe(client, sql_parent, params, f"Parent Perf {perf_view}")
+    # 今期 / 前年同期は1回の走査で条件付き集計し、差額順の並べ替えと上位50件の切り出しも BigQuery 側で行う
+    # 年度は定数パラメータで渡す（fiscal_year でクラスタ/パーティション化されていればブロックを枝刈りできる）
+    params.update(date_params())
+    ty_filter = (
+        f"{c(colmap,'fiscal_year')} = @current_fy"
+        f" AND {c(colmap,'sales_date')} >= DATE(@current_fy, 4, 1)"
+    )
+    py_filter = (
+        f"{c(colmap,'fiscal_year')} = @current_fy - 1"
+        f" AND {c(colmap,'sales_date')} BETWEEN DATE(@current_fy - 1, 4, 1) AND {SQL_PY_TODAY}"
+    )
+    sql_parent = f"""
+        SELECT
+          {key_select},
+          IFNULL(SUM(IF({ty_filter}, {c(colmap,'sales_amount')}, 0)), 0) AS `今期売上`,
+          IFNULL(SUM(IF({py_filter}, {c(colmap,'sales_amount')}, 0)), 0) AS `前年同期売上`,
+          IFNULL(SUM(IF({ty_filter}, {c(colmap,'gross_profit')}, 0)), 0) AS `今期粗利`,
+          IFNULL(SUM(IF({py_filter}, {c(colmap,'gross_profit')}, 0)), 0) AS `前年同期粗利`
+        FROM `{VIEW_UNIFIED}`
+        {_compose_where(role_filter, scope_filter_clause, f"(({ty_filter}) OR ({py_filter}))")}
+        GROUP BY {group_by}
+        HAVING `今期売上` > 0 OR `前年同期売上` > 0
+        ORDER BY `今期売上` - `前年同期売上` {sort_order}, {group_by}
+        LIMIT 50
+    """
+    df_parent = query_df_cached(client, sql_parent, params, f"Parent Perf {perf_view}")
     if df_parent.empty:
         st.info("表示できるデータがありません。")
         return
 
-    df_parent = df_parent.copy()
+    name_cols = [parent_key_col] + (["名称"] if parent_key_col != "名称" else [])
+    parent_money_cols = ["今期売上", "前年同期売上", "今期粗利", "前年同期粗利"]
+    if not all(is_numeric_dtype(df_parent[col]) for col in parent_money_cols):
+        df_parent[parent_money_cols] = df_parent[parent_money_cols].apply(pd.to_numeric, errors="coerce")
+    df_parent[parent_money_cols] = df_parent[parent_money_cols].to_numpy(dtype="float64", na_value=0.0)
     df_parent["売上差額"] = df_parent["今期売上"] - df_parent["前年同期売上"]
-    df_parent["売上成長率"] = df_parent.apply(
-        lambda r: ((r["今期売上"] / r["前年同期売上"] - 1) * 100) if r["前年同期売上"] else 0,
-        axis=1,
-    )
+    df_parent = df_parent[name_cols + parent_money_cols + ["売上差額"]]
+    cur = df_parent["今期売上"].to_numpy(dtype=np.float64, na_value=np.nan)
+    prev = df_parent["前年同期売上"].to_numpy(dtype=np.float64, na_value=np.nan)
+    df_parent["売上成長率"] = np.where(prev != 0, (cur / np.where(prev != 0, prev, 1.0) - 1) * 100.0, 0.0)
     df_parent["粗利差額"] = df_parent["今期粗利"] - df_parent["前年同期粗利"]
 
-    def rank_icon(rank: int, mode: str) -> str:
-        if mode == "ベスト":
-            return "🥇 1位" if rank == 1 else ("🥈 2位" if rank == 2 else ("🥉 3位" if rank == 3 else f"🌟 {rank}位"))
-        return "🚨 1位" if rank == 1 else ("⚠️ 2位" if rank == 2 else ("⚡ 3位" if rank == 3 else f"📉 {rank}位"))
-
-    df_parent.insert(0, "順位", [rank_icon(i + 1, perf_mode) for i in range(len(df_parent))])
+    df_parent.insert(0, "順位", rank_icons(len(df_parent), perf_mode))
 
     if perf_view == "グループ別" and group_src:
         st.caption(f"抽出元グループ列: `{group_src}`")
@@ -1165,21 +1934,17 @@ def render_group_underperformance_section(
     show_cols += ["名称", "今期売上", "前年同期売上", "売上差額", "売上成長率", "今期粗利", "前年同期粗利", "粗利差額"]
 
     st.markdown("👇 **表の行をクリックすると、下の要因分析（商品ドリルダウン）が切り替わります**")
+    parent_display_money_cols = ["今期売上", "前年同期売上", "売上差額", "今期粗利", "前年同期粗利", "粗利差額"]
+    df_parent_view = _safe_fill_for_display(df_parent[show_cols], parent_display_money_cols)
     event = st.dataframe(
-        df_parent[show_cols].style.format(
-            {
-                "今期売上": "¥{:,.0f}",
-                "前年同期売上": "¥{:,.0f}",
-                "売上差額": "¥{:,.0f}",
-                "売上成長率": "{:,.1f}%",
-                "今期粗利": "¥{:,.0f}",
-                "前年同期粗利": "¥{:,.0f}",
-                "粗利差額": "¥{:,.0f}",
-            }
-        ),
+        df_parent_view,
         use_container_width=True,
         hide_index=True,
-        column_config=create_default_column_config(df_parent[show_cols]),
+        column_config=display_column_config(
+            parent_display_money_cols,
+            pct_cols=["売上成長率"],
+            base=create_default_column_config(df_parent_view),
+        ),
         selection_mode="single-row",
         on_select="rerun",
         key=f"grid_parent_{perf_view}_{perf_mode}",
@@ -1208,82 +1973,52 @@ def render_group_underperformance_section(
     drill_params: Dict[str, Any] = dict(scope.params or {})
     if not role.role_admin_view:
         drill_params["login_email"] = role.login_email
+    # 今期・前年同期以外の行は集計結果に寄与しないので、定数の年度条件で先に落とす
+    drill_params.update(date_params())
+    drill_fy_window = fy_window_sql(colmap)
 
     if perf_view == "グループ別":
         if not group_expr:
             st.info("グループ列が無いため要因分析できません。")
             return
-        drill_filter_sql = _compose_where(drill_role_filter, drill_scope_clause, f"{group_expr} = @parent_id")
+        drill_filter_sql = _compose_where(
+            drill_role_filter, drill_scope_clause, drill_fy_window, f"{group_expr} = @parent_id"
+        )
         drill_params["parent_id"] = selected_parent_id
     else:
         drill_filter_sql = _compose_where(
-            drill_role_filter, drill_scope_clause, f"CAST({c(colmap,'customer_code')} AS STRING) = @parent_id"
+            drill_role_filter,
+            drill_scope_clause,
+            drill_fy_window,
+            f"CAST({c(colmap,'customer_code')} AS STRING) = @parent_id",
         )
         drill_params["parent_id"] = selected_parent_id
 
-    sql_drill = f"""
-        WITH fy AS (
-          SELECT (
-            EXTRACT(YEAR FROM CURRENT_DATE('Asia/Tokyo'))
-            - CASE WHEN EXTRACT(MONTH FROM CURRENT_DATE('Asia/Tokyo')) < 4 THEN 1 ELSE 0 END
-          ) AS current_fy,
-          DATE_SUB(CURRENT_DATE('Asia/Tokyo'), INTERVAL 1 YEAR) AS py_today
-        ),
-        base_raw AS (
-          SELECT
-            COALESCE(
-              NULLIF(NULLIF(TRIM(CAST({c(colmap,'yj_code')} AS STRING)), ''), '0'),
-              TRIM(CAST({c(colmap,'product_name')} AS STRING))
-            ) AS yj_key,
-            CAST({c(colmap,'product_name')} AS STRING) AS product_base,
-            SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS ty_sales,
-            SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 AND {c(colmap,'sales_date')} <= py_today THEN {c(colmap,'sales_amount')} ELSE 0 END) AS py_sales
-          FROM `{VIEW_UNIFIED}`
-          CROSS JOIN fy
-          {drill_filter_sql}
-          GROUP BY yj_key, product_base
-        ),
-        base AS (
-          SELECT
-            yj_key AS yj_code,
-            ARRAY_AGG(product_base ORDER BY ty_sales DESC LIMIT 1)[OFFSET(0)] AS product_name,
-            SUM(ty_sales) AS ty_sales,
-            SUM(py_sales) AS py_sales
-          FROM base_raw
-          GROUP BY yj_code
-        )
-        SELECT
-          yj_code,
-          product_name,
-          ty_sales AS sales_amount,
-          py_sales AS py_sales_amount,
-          (ty_sales - py_sales) AS sales_diff_yoy
-        FROM base
-        WHERE ty_sales > 0 OR py_sales > 0
-        ORDER BY sales_diff_yoy {sort_order}
-    """
-    df_drill = query_df_safe(client, sql_drill, drill_params, "Parent Drilldown")
+    sql_drill = build_parent_drill_sql(colmap, drill_filter_sql, sort_order)
+    df_drill = query_df_cached(client, sql_drill, drill_params, "Parent Drilldown")
     if df_drill.empty:
         st.info("要因データが見つかりません。")
         return
 
-    df_drill = df_drill.copy()
-    df_drill["product_name"] = df_drill["product_name"].apply(normalize_product_display_name)
-    df_drill.insert(0, "要因順位", [rank_icon(i + 1, perf_mode) for i in range(len(df_drill))])
+    df_drill["product_name"] = normalize_product_display_names(df_drill["product_name"])
+    df_drill.insert(0, "要因順位", rank_icons(len(df_drill), perf_mode))
 
+    drill_money_cols = ["今期売上", "前年同期売上", "前年比差額"]
     st.dataframe(
-        df_drill[["要因順位", "product_name", "sales_amount", "py_sales_amount", "sales_diff_yoy"]]
-        .rename(
-            columns={
-                "product_name": "代表商品名(成分)",
-                "sales_amount": "今期売上",
-                "py_sales_amount": "前年同期売上",
-                "sales_diff_yoy": "前年比差額",
-            }
-        )
-        .style.format({"今期売上": "¥{:,.0f}", "前年同期売上": "¥{:,.0f}", "前年比差額": "¥{:,.0f}"}),
+        _safe_fill_for_display(
+            df_drill[["要因順位", "product_name", "sales_amount", "py_sales_amount", "sales_diff_yoy"]].rename(
+                columns={
+                    "product_name": "代表商品名(成分)",
+                    "sales_amount": "今期売上",
+                    "py_sales_amount": "前年同期売上",
+                    "sales_diff_yoy": "前年比差額",
+                }
+            ),
+            drill_money_cols,
+        ),
         use_container_width=True,
         hide_index=True,
+        column_config=display_column_config(drill_money_cols),
     )
 
 
@@ -1310,11 +2045,14 @@ def render_yoy_section(
         st.session_state.yoy_mode = mode_name
         role_filter = "" if is_admin else f"{c(colmap,'login_email')} = @login_email"
         scope_where = scope.where_clause()
-        combined_where = _compose_where(role_filter, scope_where)
+        # 今期・前期以外の行は集計しても 0 にしかならないので、スキャン段階で落とす
+        fy_window = fy_window_sql(colmap)
+        combined_where = _compose_where(role_filter, scope_where, fy_window)
 
         params: Dict[str, Any] = dict(scope.params or {})
         if not is_admin:
             params["login_email"] = login_email
+        params.update(date_params())
 
         if mode_name == "ワースト":
             diff_filter = "py_sales > 0 AND (ty_sales - py_sales) < 0"
@@ -1327,27 +2065,20 @@ def render_yoy_section(
             order_by = "ty_sales DESC"
 
         sql = f"""
-            WITH fy AS (
-              SELECT (EXTRACT(YEAR FROM CURRENT_DATE('Asia/Tokyo')) - CASE WHEN EXTRACT(MONTH FROM CURRENT_DATE('Asia/Tokyo')) < 4 THEN 1 ELSE 0 END) AS current_fy
-            ),
-            base_raw AS (
+            WITH base_raw AS (
               SELECT
-                COALESCE(
-                  NULLIF(NULLIF(TRIM(CAST({c(colmap,'yj_code')} AS STRING)), ''), '0'),
-                  TRIM(CAST({c(colmap,'product_name')} AS STRING))
-                ) AS yj_key,
+                {sql_yj_key_expr(colmap)} AS yj_key,
                 CAST({c(colmap,'product_name')} AS STRING) AS original_name,
-                SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS ty_sales,
-                SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS py_sales
+                SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS ty_sales,
+                SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS py_sales
               FROM `{VIEW_UNIFIED}`
-              CROSS JOIN fy
               {combined_where}
               GROUP BY yj_key, original_name
             ),
             base AS (
               SELECT
                 yj_key AS yj_code,
-                ARRAY_AGG(original_name ORDER BY ty_sales DESC LIMIT 1)[OFFSET(0)] AS product_name,
+                ANY_VALUE(original_name HAVING MAX ty_sales) AS product_name,
                 SUM(ty_sales) AS ty_sales,
                 SUM(py_sales) AS py_sales
               FROM base_raw
@@ -1375,21 +2106,26 @@ def render_yoy_section(
         st.info("ランキングを読み込むにはボタンを押してください。")
         return
 
-    df_disp = st.session_state.yoy_df.copy()
-    df_disp["product_name"] = df_disp["product_name"].apply(normalize_product_display_name)
+    df_disp = st.session_state.yoy_df.copy(deep=False)
+    df_disp["product_name"] = normalize_product_display_names(df_disp["product_name"])
 
     st.markdown(f"#### 🏆 第一階層：成分（YJ）ベース {st.session_state.yoy_mode} ランキング")
+    yoy_money_cols = ["今期売上", "前期売上", "前年比差額"]
     event = st.dataframe(
-        df_disp[["product_name", "ty_sales", "py_sales", "sales_diff_yoy"]].rename(
-            columns={
-                "product_name": "代表商品名(成分)",
-                "ty_sales": "今期売上",
-                "py_sales": "前期売上",
-                "sales_diff_yoy": "前年比差額",
-            }
-        ).style.format({"今期売上": "¥{:,.0f}", "前期売上": "¥{:,.0f}", "前年比差額": "¥{:,.0f}"}),
+        _safe_fill_for_display(
+            df_disp[["product_name", "ty_sales", "py_sales", "sales_diff_yoy"]].rename(
+                columns={
+                    "product_name": "代表商品名(成分)",
+                    "ty_sales": "今期売上",
+                    "py_sales": "前期売上",
+                    "sales_diff_yoy": "前年比差額",
+                }
+            ),
+            yoy_money_cols,
+        ),
         use_container_width=True,
         hide_index=True,
+        column_config=display_column_config(yoy_money_cols),
         selection_mode="single-row",
         on_select="rerun",
         key=f"grid_yoy_{st.session_state.yoy_mode}",
@@ -1408,8 +2144,8 @@ def render_yoy_section(
 
     yj_opts = ["全成分を表示"] + list(df_disp["yj_code"].astype(str).unique())
     yj_display_map = {"全成分を表示": "🚩 スコープ内の全成分を合計して表示"}
-    for _, r in df_disp.iterrows():
-        yj_display_map[str(r["yj_code"])] = f"{normalize_product_display_name(r['product_name'])} (差額: ¥{r['sales_diff_yoy']:,.0f})"
+    for yj, name, diff in zip(df_disp["yj_code"].astype(str), df_disp["product_name"], df_disp["sales_diff_yoy"]):
+        yj_display_map[yj] = f"{name} (差額: ¥{diff:,.0f})"
 
     current_index = yj_opts.index(selected_yj_default) if selected_yj_default in yj_opts else 0
 
@@ -1426,97 +2162,95 @@ def render_yoy_section(
     drill_params = dict(scope.params or {})
     if not is_admin:
         drill_params["login_email"] = login_email
+    drill_params.update(date_params())
 
     yj_filter = ""
     if selected_yj != "全成分を表示":
-        yj_filter = f"""
-            COALESCE(
-              NULLIF(NULLIF(TRIM(CAST({c(colmap,'yj_code')} AS STRING)), ''), '0'),
-              TRIM(CAST({c(colmap,'product_name')} AS STRING))
-            ) = @target_yj
-        """
+        yj_filter = f"{sql_yj_key_expr(colmap)} = @target_yj"
         drill_params["target_yj"] = selected_yj
 
     final_where = _compose_where(role_filter, scope_where, yj_filter)
+    # 得意先別は今期・前期とも 0 の行を HAVING で除くため、対象年度外はスキャン段階で落とせる
+    cust_where = _compose_where(
+        role_filter, scope_where, yj_filter, fy_window_sql(colmap)
+    )
     sort_order = "ASC" if st.session_state.yoy_mode == "ワースト" else "DESC"
 
-    fy_cte = f"""
-        WITH fy AS (
-          SELECT (
-            EXTRACT(YEAR FROM CURRENT_DATE('Asia/Tokyo'))
-            - CASE WHEN EXTRACT(MONTH FROM CURRENT_DATE('Asia/Tokyo')) < 4 THEN 1 ELSE 0 END
-          ) AS current_fy
-        )
-    """
-
-    st.markdown("#### 🧾 得意先別内訳（前年差額）")
     sql_cust = f"""
-        {fy_cte}
         SELECT
           {c(colmap,'customer_name')} AS `得意先名`,
-          SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
-          SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前期売上`
+          SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
+          SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前期売上`
         FROM `{VIEW_UNIFIED}`
-        CROSS JOIN fy
-        {final_where}
+        {cust_where}
         GROUP BY 1
         HAVING `今期売上`!=0 OR `前期売上`!=0
         ORDER BY (`今期売上`-`前期売上`) {sort_order}
         LIMIT 50
     """
-    df_cust = query_df_safe(client, sql_cust, drill_params, "YoY Cust Detail")
-    if not df_cust.empty:
-        df_cust["前年差額"] = df_cust["今期売上"] - df_cust["前期売上"]
-        st.dataframe(
-            df_cust.style.format({"今期売上": "¥{:,.0f}", "前期売上": "¥{:,.0f}", "前年差額": "¥{:,.0f}"}),
-            use_container_width=True,
-            hide_index=True,
-        )
-
-    st.markdown("#### 🧪 原因追及：JAN・商品別（前年差額寄与）")
     sql_jan = f"""
-        {fy_cte}
         SELECT
           CAST({c(colmap,'jan_code')} AS STRING) AS `JAN`,
           CAST({c(colmap,'product_name')} AS STRING) AS `商品名`,
           CAST({c(colmap,'package_unit')} AS STRING) AS `包装`,
-          SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
-          SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前期売上`
+          SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
+          SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前期売上`
         FROM `{VIEW_UNIFIED}`
-        CROSS JOIN fy
         {final_where}
         GROUP BY 1,2,3
         ORDER BY (`今期売上`-`前期売上`) {sort_order}
     """
-    df_jan = query_df_safe(client, sql_jan, drill_params, "YoY JAN Detail")
-    if not df_jan.empty:
-        df_jan["前年差額"] = df_jan["今期売上"] - df_jan["前期売上"]
-        st.dataframe(
-            df_jan.style.format({"今期売上": "¥{:,.0f}", "前期売上": "¥{:,.0f}", "前年差額": "¥{:,.0f}"}),
-            use_container_width=True,
-            hide_index=True,
-        )
-
-    st.markdown("#### 📅 原因追及：月次推移（前年差額）")
     sql_month = f"""
-        {fy_cte}
         SELECT
           FORMAT_DATE('%Y-%m', {c(colmap,'sales_date')}) AS `年月`,
-          SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
-          SUM(CASE WHEN {c(colmap,'fiscal_year')} = current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前期売上`
+          SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `今期売上`,
+          SUM(CASE WHEN {c(colmap,'fiscal_year')} = @current_fy - 1 THEN {c(colmap,'sales_amount')} ELSE 0 END) AS `前期売上`
         FROM `{VIEW_UNIFIED}`
-        CROSS JOIN fy
         {final_where}
         GROUP BY 1
         ORDER BY 1
     """
-    df_month = query_df_safe(client, sql_month, drill_params, "YoY Month Trend")
+    # 3つの内訳は互いに独立なので、まとめて投入して BigQuery 側で並行実行させる
+    yoy_dfs = query_dfs_cached(
+        client,
+        {
+            "cust": (sql_cust, drill_params, "YoY Cust Detail"),
+            "jan": (sql_jan, drill_params, "YoY JAN Detail"),
+            "month": (sql_month, drill_params, "YoY Month Trend"),
+        },
+    )
+
+    st.markdown("#### 🧾 得意先別内訳（前年差額）")
+    df_cust = yoy_dfs["cust"]
+    if not df_cust.empty:
+        df_cust["前年差額"] = df_cust["今期売上"] - df_cust["前期売上"]
+        st.dataframe(
+            _safe_fill_for_display(df_cust, YOY_BREAKDOWN_MONEY_COLS),
+            use_container_width=True,
+            hide_index=True,
+            column_config=display_column_config(YOY_BREAKDOWN_MONEY_COLS),
+        )
+
+    st.markdown("#### 🧪 原因追及：JAN・商品別（前年差額寄与）")
+    df_jan = yoy_dfs["jan"]
+    if not df_jan.empty:
+        df_jan["前年差額"] = df_jan["今期売上"] - df_jan["前期売上"]
+        st.dataframe(
+            _safe_fill_for_display(df_jan, YOY_BREAKDOWN_MONEY_COLS),
+            use_container_width=True,
+            hide_index=True,
+            column_config=display_column_config(YOY_BREAKDOWN_MONEY_COLS),
+        )
+
+    st.markdown("#### 📅 原因追及：月次推移（前年差額）")
+    df_month = yoy_dfs["month"]
     if not df_month.empty:
         df_month["前年差額"] = df_month["今期売上"] - df_month["前期売上"]
         st.dataframe(
-            df_month.style.format({"今期売上": "¥{:,.0f}", "前期売上": "¥{:,.0f}", "前年差額": "¥{:,.0f}"}),
+            _safe_fill_for_display(df_month, YOY_BREAKDOWN_MONEY_COLS),
             use_container_width=True,
             hide_index=True,
+            column_config=display_column_config(YOY_BREAKDOWN_MONEY_COLS),
         )
 
 
@@ -1542,6 +2276,8 @@ def render_new_delivery_trends(
         st.error("VIEW_NEW_DELIVERY に login_email 列が無いため、担当者スコープ絞り込みができません。")
         st.stop()
 
+    nd_table, nd_colmap = resolve_new_delivery_source(client, nd_colmap)
+
     if "nd_trend_days" not in st.session_state:
         st.session_state.nd_trend_days = 60
     if "nd_trend_mode" not in st.session_state:
@@ -1551,237 +2287,224 @@ def render_new_delivery_trends(
     mode = st.radio("表示単位", ["🏢 グループ", "🏥 得意先", "💊 商品"], horizontal=True, key="nd_trend_mode")
 
     where_staff = "" if is_admin else f"AND nd.{c(nd_colmap,'login_email')} = @login_email"
-    base_params = {} if is_admin else {"login_email": login_email}
-
-    group_expr, _ = resolve_customer_group_sql_expr(client)
-    if group_expr:
-        cust_dim_sql = f"""
-          SELECT
-            CAST({c(unified_colmap,'customer_code')} AS STRING) AS customer_code,
-            ANY_VALUE(CAST({c(unified_colmap,'customer_name')} AS STRING)) AS customer_name,
-            ANY_VALUE({group_expr}) AS group_name
-          FROM `{VIEW_UNIFIED}`
-          GROUP BY customer_code
-        """
-    else:
-        cust_dim_sql = f"""
-          SELECT
-            CAST({c(unified_colmap,'customer_code')} AS STRING) AS customer_code,
-            ANY_VALUE(CAST({c(unified_colmap,'customer_name')} AS STRING)) AS customer_name,
-            '未設定' AS group_name
-          FROM `{VIEW_UNIFIED}`
-          GROUP BY customer_code
-        """
-
-    nd_prod_col = nd_colmap.get("product_name")
-    if nd_prod_col:
-        prod_expr = f"CAST(nd.{nd_prod_col} AS STRING)"
+    base_params = date_params()
+    base_params["days"] = int(days)
+    if not is_admin:
+        base_params["login_email"] = login_email
+
+    cust_dim_sql = build_customer_dim_sql(client, unified_colmap)
+
+    # スライダー・ラジオを行き来しても、一度見た組み合わせはクエリを投げずにセッション内の結果を使う。
+    # 参照元（日次サマリー / VIEW）と基準日もキーに含め、切替や日付の変わり目で古い集計を出さない
+    parent_sig = (mode, days, login_email, is_admin, nd_table, base_params["today"])
+    parent_cache: OrderedDict = st.session_state.setdefault("nd_parent_cache", OrderedDict())
+    cached_parent = parent_cache.get(parent_sig)
+    if cached_parent is not None and time.monotonic() - cached_parent[0] > ND_PARENT_CACHE_TTL_SEC:
+        parent_cache.pop(parent_sig)
+        cached_parent = None
+
+    nd_cust_code = nd_string_expr(nd_table, nd_colmap, "customer_code")
+    if nd_colmap.get("product_name"):
+        prod_expr = nd_string_expr(nd_table, nd_colmap, "product_name")
     else:
-        prod_expr = f"CONCAT('商品名不明（JAN）:', CAST(nd.{c(nd_colmap,'jan_code')} AS STRING))"
+        prod_expr = f"CONCAT('商品名不明（JAN）:', {nd_string_expr(nd_table, nd_colmap, 'jan_code')})"
 
     if mode.startswith("🏢"):
         sql_parent = f"""
-          WITH td AS (SELECT CURRENT_DATE('Asia/Tokyo') AS today),
-          cust_dim AS ({cust_dim_sql})
+          WITH cust_dim AS ({cust_dim_sql})
           SELECT
             COALESCE(cd.group_name, '未設定') AS group_name,
-            COUNT(DISTINCT CAST(nd.{c(nd_colmap,'customer_code')} AS STRING)) AS customer_cnt,
-            COUNT(DISTINCT CAST(nd.{c(nd_colmap,'jan_code')} AS STRING)) AS item_cnt,
-            SUM(nd.{c(nd_colmap,'sales_amount')}) AS sales_amount,
-            SUM(nd.{c(nd_colmap,'gross_profit')}) AS gross_profit
-          FROM `{VIEW_NEW_DELIVERY}` nd
-          CROSS JOIN td
+            {sql_count_distinct(f"nd.{c(nd_colmap,'customer_code')}")} AS customer_cnt,
+            {sql_count_distinct(f"nd.{c(nd_colmap,'jan_code')}")} AS item_cnt,
+            IFNULL(SUM(nd.{c(nd_colmap,'sales_amount')}), 0) AS sales_amount,
+            IFNULL(SUM(nd.{c(nd_colmap,'gross_profit')}), 0) AS gross_profit
+          FROM `{nd_table}` nd
           LEFT JOIN cust_dim cd
-            ON CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) = cd.customer_code
-          WHERE nd.{c(nd_colmap,'first_sales_date')} >= DATE_SUB(today, INTERVAL {days} DAY)
+            ON {nd_cust_code} = cd.customer_code
+          WHERE {nd_window_sql(nd_colmap)}
             {where_staff}
           GROUP BY group_name
           ORDER BY sales_amount DESC
           LIMIT 300
         """
-        df_parent = query_df_safe(client, sql_parent, base_params, label="New Delivery Trend Groups")
+        def load_parent() -> pd.DataFrame:
+            return query_df_cached(client, sql_parent, base_params, label="New Delivery Trend Groups", arrow_strings=True)
+
         key_col = "group_name"
         title = "🏢 グループトレンド（新規納品）"
 
     elif mode.startswith("🏥"):
+        # 得意先単位の集計は新規納品VIEWだけで完結するので、名称・グループは得意先マスタ（1h キャッシュ）と手元で結合する
         sql_parent = f"""
-          WITH td AS (SELECT CURRENT_DATE('Asia/Tokyo') AS today),
-          cust_dim AS ({cust_dim_sql})
           SELECT
-            CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) AS customer_code,
-            ANY_VALUE(cd.customer_name) AS customer_name,
-            ANY_VALUE(COALESCE(cd.group_name, '未設定')) AS group_name,
-            COUNT(DISTINCT CAST(nd.{c(nd_colmap,'jan_code')} AS STRING)) AS item_cnt,
-            SUM(nd.{c(nd_colmap,'sales_amount')}) AS sales_amount,
-            SUM(nd.{c(nd_colmap,'gross_profit')}) AS gross_profit
-          FROM `{VIEW_NEW_DELIVERY}` nd
-          CROSS JOIN td
-          LEFT JOIN cust_dim cd
-            ON CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) = cd.customer_code
-          WHERE nd.{c(nd_colmap,'first_sales_date')} >= DATE_SUB(today, INTERVAL {days} DAY)
+            {nd_cust_code} AS customer_code,
+            {sql_count_distinct(f"nd.{c(nd_colmap,'jan_code')}")} AS item_cnt,
+            IFNULL(SUM(nd.{c(nd_colmap,'sales_amount')}), 0) AS sales_amount,
+            IFNULL(SUM(nd.{c(nd_colmap,'gross_profit')}), 0) AS gross_profit
+          FROM `{nd_table}` nd
+          WHERE {nd_window_sql(nd_colmap)}
             {where_staff}
           GROUP BY customer_code
           ORDER BY sales_amount DESC
           LIMIT 300
         """
-        df_parent = query_df_safe(client, sql_parent, base_params, label="New Delivery Trend Customers")
+        def load_parent() -> pd.DataFrame:
+            label = "New Delivery Trend Customers"
+            parent_job = submit_query(client, sql_parent, base_params, label)
+            df_dim = fetch_customer_dim(client, cust_dim_sql)
+            df_cust = collect_query(parent_job, sql_parent, label, arrow_strings=True)
+            if df_cust.empty:
+                return df_cust
+            dim_cols = ["customer_code", "customer_name", "group_name"]
+            df_dim = df_dim.reindex(columns=dim_cols).drop_duplicates("customer_code")
+            df_cust = df_cust.merge(df_dim, on="customer_code", how="left")
+            df_cust["group_name"] = df_cust["group_name"].fillna("未設定")
+            return df_cust[dim_cols + ["item_cnt", "sales_amount", "gross_profit"]]
+
         key_col = "customer_code"
         title = "🏥 得意先トレンド（新規納品）"
 
     else:
         sql_parent = f"""
-          WITH td AS (SELECT CURRENT_DATE('Asia/Tokyo') AS today)
           SELECT
             {prod_expr} AS prod_key,
             ANY_VALUE({prod_expr}) AS product_name,
-            COUNT(DISTINCT CAST(nd.{c(nd_colmap,'customer_code')} AS STRING)) AS customer_cnt,
-            COUNT(DISTINCT CAST(nd.{c(nd_colmap,'jan_code')} AS STRING)) AS jan_cnt,
-            SUM(nd.{c(nd_colmap,'sales_amount')}) AS sales_amount,
-            SUM(nd.{c(nd_colmap,'gross_profit')}) AS gross_profit
-          FROM `{VIEW_NEW_DELIVERY}` nd
-          CROSS JOIN td
-          WHERE nd.{c(nd_colmap,'first_sales_date')} >= DATE_SUB(today, INTERVAL {days} DAY)
+            {sql_count_distinct(f"nd.{c(nd_colmap,'customer_code')}")} AS customer_cnt,
+            {sql_count_distinct(f"nd.{c(nd_colmap,'jan_code')}")} AS jan_cnt,
+            IFNULL(SUM(nd.{c(nd_colmap,'sales_amount')}), 0) AS sales_amount,
+            IFNULL(SUM(nd.{c(nd_colmap,'gross_profit')}), 0) AS gross_profit
+          FROM `{nd_table}` nd
+          WHERE {nd_window_sql(nd_colmap)}
             {where_staff}
           GROUP BY prod_key
           ORDER BY sales_amount DESC
           LIMIT 500
         """
-        df_parent = query_df_safe(client, sql_parent, base_params, label="New Delivery Trend Items")
+        def load_parent() -> pd.DataFrame:
+            return query_df_cached(client, sql_parent, base_params, label="New Delivery Trend Items", arrow_strings=True)
+
         key_col = "prod_key"
         title = "💊 商品トレンド（新規納品）"
 
+    if cached_parent is not None:
+        parent_cache.move_to_end(parent_sig)
+        df_parent = cached_parent[1]
+    else:
+        df_parent = load_parent()
+        # 空（該当なし・クエリ失敗）は保持しない
+        if not df_parent.empty:
+            parent_cache[parent_sig] = (time.monotonic(), df_parent)
+            while len(parent_cache) > ND_PARENT_CACHE_MAX:
+                parent_cache.popitem(last=False)
+
     st.markdown(f"**{title}**")
     if df_parent.empty:
         st.info("該当期間のトレンドがありません。")
         return
 
-    df_parent = df_parent.copy()
-    df_parent.insert(0, "☑", False)
-
-    if key_col == "group_name":
-        df_parent = df_parent.rename(columns={"group_name": "グループ", "customer_cnt": "得意先数", "item_cnt": "品目数", "sales_amount": "売上", "gross_profit": "粗利"})
-        display_cols = ["☑", "グループ", "得意先数", "品目数", "売上", "粗利"]
-        pick_col = "グループ"
-    elif key_col == "customer_code":
-        df_parent = df_parent.rename(columns={"customer_code": "得意先コード", "customer_name": "得意先名", "group_name": "グループ", "item_cnt": "品目数", "sales_amount": "売上", "gross_profit": "粗利"})
-        display_cols = ["☑", "得意先コード", "得意先名", "グループ", "品目数", "売上", "粗利"]
-        pick_col = "得意先コード"
-    else:
-        df_parent = df_parent.rename(columns={"prod_key": "商品キー", "product_name": "商品名", "customer_cnt": "得意先数", "jan_cnt": "JAN数", "sales_amount": "売上", "gross_profit": "粗利"})
-        display_cols = ["☑", "商品キー", "商品名", "得意先数", "JAN数", "売上", "粗利"]
-        pick_col = "商品キー"
+    df_parent = df_parent.rename(columns=ND_TREND_RENAME)
+    display_cols, pick_col = ND_TREND_VIEWS[key_col]
 
-    df_view = df_parent[display_cols].copy()
-    for colx in df_view.columns:
-        if colx != "☑":
-            df_view[colx] = df_view[colx].fillna("")
+    df_view = _safe_fill_for_display(df_parent[display_cols], ["売上", "粗利"])
 
-    column_config = {"☑": st.column_config.CheckboxColumn("選択", help="明細を表示したい行にチェック（複数可）")}
+    column_config = display_column_config(["売上", "粗利"], base=nd_count_column_config(df_view.columns))
     if "商品キー" in df_view.columns:
         column_config["商品キー"] = st.column_config.TextColumn("商品キー", width="small", help="内部キー（選択連動用）")
 
-    edited = st.data_editor(
+    # 選択は読み取り専用グリッドの行選択で受ける（data_editor の編集状態を持たない）
+    event = st.dataframe(
         df_view,
         use_container_width=True,
         hide_index=True,
-        disabled=[c_ for c_ in display_cols if c_ != "☑"],
         column_config=column_config,
-        key=f"nd_trend_editor_{key_col}_v2",
+        selection_mode="multi-row",
+        on_select="rerun",
+        key=f"nd_trend_grid_{key_col}_{days}",
     )
 
-    sel_df = edited[edited["☑"].astype(bool) == True]  # noqa: E712
+    # 選択は行位置で返る。一覧が入れ替わった直後の古い位置（範囲外）は捨てる
+    sel_rows = event.selection.rows if hasattr(event, "selection") else []
+    sel_df = df_view.iloc[[i for i in sel_rows if i < len(df_view)]]
     if sel_df.empty:
-        st.caption("☑にチェックすると下に明細が出ます（複数選択可）。")
+        st.caption("行を選択すると下に明細が出ます（複数選択可）。")
         return
 
-    selected_keys = sel_df[pick_col].astype(str).tolist()
+    # 選択順に依らず同じキー集合なら同じパラメータにして、明細を query_df_cached から引けるようにする
+    selected_keys = sorted(set(sel_df[pick_col].astype(str)))
     st.divider()
     st.markdown("#### 🧾 明細（ドリルダウン）")
 
-    if key_col == "group_name":
-        params2 = dict(base_params)
-        params2["group_keys"] = selected_keys
+    params2 = dict(base_params)
+    params2["selected_keys"] = selected_keys
+    # 3つの明細は FROM / 期間・担当者条件が共通。違いは選択キーの条件と集計粒度だけ
+    detail_from = f"""
+          FROM `{nd_table}` nd
+          LEFT JOIN cust_dim cd ON {nd_cust_code} = cd.customer_code
+          WHERE {nd_window_sql(nd_colmap)}
+            {where_staff}"""
+
+    if key_col == "prod_key":
         sql_detail = f"""
-          WITH td AS (SELECT CURRENT_DATE('Asia/Tokyo') AS today),
-          cust_dim AS ({cust_dim_sql})
+          WITH cust_dim AS ({cust_dim_sql})
           SELECT
-            CAST(nd.{c(nd_colmap,'first_sales_date')} AS DATE) AS first_sales_date,
-            COALESCE(cd.group_name, '未設定') AS group_name,
-            CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) AS customer_code,
-            ANY_VALUE(cd.customer_name) AS customer_name,
             {prod_expr} AS product_name,
-            SUM(nd.{c(nd_colmap,'sales_amount')}) AS sales_amount,
-            SUM(nd.{c(nd_colmap,'gross_profit')}) AS gross_profit
-          FROM `{VIEW_NEW_DELIVERY}` nd
-          CROSS JOIN td
-          LEFT JOIN cust_dim cd ON CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) = cd.customer_code
-          WHERE nd.{c(nd_colmap,'first_sales_date')} >= DATE_SUB(today, INTERVAL {days} DAY)
-            {where_staff}
-            AND COALESCE(cd.group_name, '未設定') IN UNNEST(@group_keys)
-          GROUP BY first_sales_date, group_name, customer_code, product_name
-          ORDER BY first_sales_date DESC, sales_amount DESC
+            {nd_cust_code} AS customer_code,
+            ANY_VALUE(cd.customer_name) AS customer_name,
+            ANY_VALUE(COALESCE(cd.group_name, '未設定')) AS group_name,
+            MIN(CAST(nd.{c(nd_colmap,'first_sales_date')} AS DATE)) AS first_sales_date_min,
+            IFNULL(SUM(nd.{c(nd_colmap,'sales_amount')}), 0) AS sales_amount,
+            IFNULL(SUM(nd.{c(nd_colmap,'gross_profit')}), 0) AS gross_profit
+          {detail_from}
+            AND {prod_expr} IN UNNEST(@selected_keys)
+          GROUP BY product_name, customer_code
+          ORDER BY sales_amount DESC
           LIMIT 5000
         """
-        df_detail = query_df_safe(client, sql_detail, params2, label="New Delivery Group Details")
-        df_detail = df_detail.rename(columns={"first_sales_date": "初回納品日", "group_name": "グループ", "customer_code": "得意先コード", "customer_name": "得意先名", "product_name": "商品名", "sales_amount": "売上", "gross_profit": "粗利"})
-    elif key_col == "customer_code":
-        params2 = dict(base_params)
-        params2["customer_keys"] = selected_keys
+        detail_label = "New Delivery Item -> Customers"
+    else:
+        if key_col == "group_name":
+            key_filter = "COALESCE(cd.group_name, '未設定') IN UNNEST(@selected_keys)"
+            detail_label = "New Delivery Group Details"
+        else:
+            key_filter = f"{nd_cust_code} IN UNNEST(@selected_keys)"
+            detail_label = "New Delivery Customer Details"
         sql_detail = f"""
-          WITH td AS (SELECT CURRENT_DATE('Asia/Tokyo') AS today),
-          cust_dim AS ({cust_dim_sql})
+          WITH cust_dim AS ({cust_dim_sql})
           SELECT
             CAST(nd.{c(nd_colmap,'first_sales_date')} AS DATE) AS first_sales_date,
             COALESCE(cd.group_name, '未設定') AS group_name,
-            CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) AS customer_code,
+            {nd_cust_code} AS customer_code,
             ANY_VALUE(cd.customer_name) AS customer_name,
             {prod_expr} AS product_name,
-            SUM(nd.{c(nd_colmap,'sales_amount')}) AS sales_amount,
-            SUM(nd.{c(nd_colmap,'gross_profit')}) AS gross_profit
-          FROM `{VIEW_NEW_DELIVERY}` nd
-          CROSS JOIN td
-          LEFT JOIN cust_dim cd ON CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) = cd.customer_code
-          WHERE nd.{c(nd_colmap,'first_sales_date')} >= DATE_SUB(today, INTERVAL {days} DAY)
-            {where_staff}
-            AND CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) IN UNNEST(@customer_keys)
+            IFNULL(SUM(nd.{c(nd_colmap,'sales_amount')}), 0) AS sales_amount,
+            IFNULL(SUM(nd.{c(nd_colmap,'gross_profit')}), 0) AS gross_profit
+          {detail_from}
+            AND {key_filter}
           GROUP BY first_sales_date, group_name, customer_code, product_name
           ORDER BY first_sales_date DESC, sales_amount DESC
           LIMIT 5000
         """
-        df_detail = query_df_safe(client, sql_detail, params2, label="New Delivery Customer Details")
-        df_detail = df_detail.rename(columns={"first_sales_date": "初回納品日", "group_name": "グループ", "customer_code": "得意先コード", "customer_name": "得意先名", "product_name": "商品名", "sales_amount": "売上", "gross_profit": "粗利"})
-    else:
-        params2 = dict(base_params)
-        params2["prod_keys"] = selected_keys
-        sql_detail = f"""
-          WITH td AS (SELECT CURRENT_DATE('Asia/Tokyo') AS today),
-          cust_dim AS ({cust_dim_sql})
-          SELECT
-            {prod_expr} AS product_name,
-            CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) AS customer_code,
-            ANY_VALUE(cd.customer_name) AS customer_name,
-            ANY_VALUE(COALESCE(cd.group_name, '未設定')) AS group_name,
-            MIN(CAST(nd.{c(nd_colmap,'first_sales_date')} AS DATE)) AS first_sales_date_min,
-            SUM(nd.{c(nd_colmap,'sales_amount')}) AS sales_amount,
-            SUM(nd.{c(nd_colmap,'gross_profit')}) AS gross_profit
-          FROM `{VIEW_NEW_DELIVERY}` nd
-          CROSS JOIN td
-          LEFT JOIN cust_dim cd ON CAST(nd.{c(nd_colmap,'customer_code')} AS STRING) = cd.customer_code
-          WHERE nd.{c(nd_colmap,'first_sales_date')} >= DATE_SUB(today, INTERVAL {days} DAY)
-            {where_staff}
-            AND {prod_expr} IN UNNEST(@prod_keys)
-          GROUP BY product_name, customer_code
-          ORDER BY sales_amount DESC
-          LIMIT 5000
-        """
-        df_detail = query_df_safe(client, sql_detail, params2, label="New Delivery Item -> Customers")
-        df_detail = df_detail.rename(columns={"product_name": "商品名", "customer_code": "得意先コード", "customer_name": "得意先名", "group_name": "グループ", "first_sales_date_min": "初回納品日（最小）", "sales_amount": "売上", "gross_profit": "粗利"})
+    df_detail = query_df_cached(client, sql_detail, params2, label=detail_label, arrow_strings=True)
+    df_detail = df_detail.rename(columns=ND_TREND_RENAME)
 
     if df_detail.empty:
         st.info("明細がありません。")
         return
 
-    st.dataframe(df_detail.fillna("").style.format({"売上": "¥{:,.0f}", "粗利": "¥{:,.0f}"}), use_container_width=True, hide_index=True)
+    # 明細本体は query_df_cached に載っているので、ページ切替の再実行はキャッシュから該当範囲を切り出すだけ
+    n_pages = -(-len(df_detail) // DETAIL_PAGE_ROWS)
+    page = 1
+    if n_pages > 1:
+        page = int(st.number_input("ページ", 1, n_pages, 1, key=f"nd_detail_page_{key_col}"))
+        st.caption(f"{len(df_detail):,} 件中 {(page - 1) * DETAIL_PAGE_ROWS + 1:,}〜{min(page * DETAIL_PAGE_ROWS, len(df_detail)):,} 件目")
+    df_page = df_detail.iloc[(page - 1) * DETAIL_PAGE_ROWS : page * DETAIL_PAGE_ROWS]
+
+    st.dataframe(
+        _safe_fill_for_display(df_page, ["売上", "粗利"]),
+        use_container_width=True,
+        hide_index=True,
+        column_config=display_column_config(["売上", "粗利"], date_cols=["初回納品日（最小）"]),
+    )
 
 
 def render_new_deliveries_section(
@@ -1810,38 +2533,51 @@ def render_new_deliveries_section(
         st.session_state.nd_summary_df = pd.DataFrame()
 
     if st.button("新規納品実績を読み込む", key="btn_new_deliv"):
+        nd_table, nd_colmap = resolve_new_delivery_source(client, nd_colmap)
         where_ext = "" if is_admin else f"AND {c(nd_colmap,'login_email')} = @login_email"
-        params = None if is_admin else {"login_email": login_email}
+        params = date_params()
+        if not is_admin:
+            params["login_email"] = login_email
 
+        # 3期間を1回の走査で集計（最も広い期間だけ読み、各行を該当期間へ振り分ける）。
+        # 該当行が無い期間も 0 件の行として残すため periods 側から LEFT JOIN する
+        fsd = c(nd_colmap, "first_sales_date")
         sql = f"""
-        WITH td AS (SELECT CURRENT_DATE('Asia/Tokyo') AS today)
+        WITH periods AS (
+          SELECT period FROM UNNEST(['① 昨日', '② 直近7日', '③ 当月']) AS period
+        ),
+        f AS (
+          SELECT
+            period,
+            {nd_string_expr(nd_table, nd_colmap, 'customer_code', alias='')} AS customer_code,
+            {nd_string_expr(nd_table, nd_colmap, 'jan_code', alias='')} AS jan_code,
+            {c(nd_colmap,'sales_amount')} AS sales_amount,
+            {c(nd_colmap,'gross_profit')} AS gross_profit
+          FROM `{nd_table}`,
+            UNNEST([
+              IF({fsd} = DATE_SUB({SQL_TODAY}, INTERVAL 1 DAY), '① 昨日', NULL),
+              IF({fsd} >= DATE_SUB({SQL_TODAY}, INTERVAL 7 DAY), '② 直近7日', NULL),
+              IF({fsd} BETWEEN DATE_TRUNC({SQL_TODAY}, MONTH) AND {SQL_TODAY}, '③ 当月', NULL)
+            ]) AS period
+          WHERE {fsd} BETWEEN LEAST(
+              DATE_SUB({SQL_TODAY}, INTERVAL 7 DAY),
+              DATE_TRUNC({SQL_TODAY}, MONTH)
+            ) AND {SQL_TODAY}
+            AND period IS NOT NULL
+            {where_ext}
+        )
         SELECT
-          '① 昨日' AS `期間`,
-          COUNT(DISTINCT CAST({c(nd_colmap,'customer_code')} AS STRING)) AS `得意先数`,
-          COUNT(DISTINCT CAST({c(nd_colmap,'jan_code')} AS STRING)) AS `品目数`,
-          SUM({c(nd_colmap,'sales_amount')}) AS `売上`,
-          SUM({c(nd_colmap,'gross_profit')}) AS `粗利`
-        FROM `{VIEW_NEW_DELIVERY}` CROSS JOIN td
-        WHERE {c(nd_colmap,'first_sales_date')} = DATE_SUB(today, INTERVAL 1 DAY) {where_ext}
-        UNION ALL
-        SELECT '② 直近7日',
-          COUNT(DISTINCT CAST({c(nd_colmap,'customer_code')} AS STRING)),
-          COUNT(DISTINCT CAST({c(nd_colmap,'jan_code')} AS STRING)),
-          SUM({c(nd_colmap,'sales_amount')}),
-          SUM({c(nd_colmap,'gross_profit')})
-        FROM `{VIEW_NEW_DELIVERY}` CROSS JOIN td
-        WHERE {c(nd_colmap,'first_sales_date')} >= DATE_SUB(today, INTERVAL 7 DAY) {where_ext}
-        UNION ALL
-        SELECT '③ 当月',
-          COUNT(DISTINCT CAST({c(nd_colmap,'customer_code')} AS STRING)),
-          COUNT(DISTINCT CAST({c(nd_colmap,'jan_code')} AS STRING)),
-          SUM({c(nd_colmap,'sales_amount')}),
-          SUM({c(nd_colmap,'gross_profit')})
-        FROM `{VIEW_NEW_DELIVERY}` CROSS JOIN td
-        WHERE DATE_TRUNC({c(nd_colmap,'first_sales_date')}, MONTH) = DATE_TRUNC(today, MONTH) {where_ext}
+          p.period AS `期間`,
+          {sql_count_distinct("f.customer_code")} AS `得意先数`,
+          {sql_count_distinct("f.jan_code")} AS `品目数`,
+          IFNULL(SUM(f.sales_amount), 0) AS `売上`,
+          IFNULL(SUM(f.gross_profit), 0) AS `粗利`
+        FROM periods p
+        LEFT JOIN f USING (period)
+        GROUP BY p.period
         ORDER BY `期間`
         """
-        df_new = query_df_safe(client, sql, params, label="New Deliveries")
+        df_new = query_df_safe(client, sql, params, label="New Deliveries", fast=True)
         st.session_state.nd_summary_df = df_new.copy()
         st.session_state.nd_summary_loaded = True
 
@@ -1853,11 +2589,13 @@ def render_new_deliveries_section(
     if df_new is None or df_new.empty:
         st.info("新規納品データがありません。")
     else:
-        df_new = df_new.copy()
-        for coln in ["売上", "粗利"]:
-            if coln in df_new.columns:
-                df_new[coln] = pd.to_numeric(df_new[coln], errors="coerce").fillna(0)
-        st.dataframe(df_new.style.format({"売上": "¥{:,.0f}", "粗利": "¥{:,.0f}"}), use_container_width=True, hide_index=True)
+        df_new = _safe_fill_for_display(df_new, ["売上", "粗利"])
+        st.dataframe(
+            df_new,
+            use_container_width=True,
+            hide_index=True,
+            column_config=display_column_config(["売上", "粗利"], base=nd_count_column_config(df_new.columns)),
+        )
 
     st.divider()
     render_new_delivery_trends(client, login_email, is_admin, nd_colmap, unified_colmap)
@@ -1886,7 +2624,7 @@ def render_adoption_alerts_section(client: bigquery.Client, login_email: str, is
             CASE WHEN adoption_status LIKE '%🔴%' THEN 1 WHEN adoption_status LIKE '%🟡%' THEN 2 ELSE 3 END,
             `売上差額` ASC
     """
-    df_alerts = query_df_safe(client, sql, params, "Adoption Alerts")
+    df_alerts = query_df_safe(client, sql, params, "Adoption Alerts", arrow_strings=True)
     if df_alerts.empty:
         st.info("現在、アラート対象のアイテムはありません。")
         return
@@ -1909,13 +2647,15 @@ def render_adoption_alerts_section(client: bigquery.Client, login_email: str, is
         st.info("選択された条件に一致するアイテムはありません。")
         return
 
-    for col in ["今期売上", "前期売上", "売上差額"]:
-        df_display[col] = pd.to_numeric(df_display[col], errors="coerce").fillna(0)
+    df_display = _safe_fill_for_display(
+        df_display, ["今期売上", "前期売上", "売上差額"], text_cols=["得意先名", "商品名", "ステータス"]
+    )
 
     st.dataframe(
-        df_display.style.format({"今期売上": "¥{:,.0f}", "前期売上": "¥{:,.0f}", "売上差額": "¥{:,.0f}", "最終購入日": lambda t: t.strftime("%Y-%m-%d") if pd.notnull(t) else ""}),
+        df_display,
         use_container_width=True,
         hide_index=True,
+        column_config=display_column_config(["今期売上", "前期売上", "売上差額"], date_cols=["最終購入日"]),
     )
 
 
@@ -1958,54 +2698,105 @@ def render_customer_drilldown(
         return
 
     opts = {str(row["customer_code"]): f"{row['customer_code']} : {row['customer_name']}" for _, row in filtered_df.iterrows()}
-    sel = st.selectbox("得意先を選択", options=list(opts.keys()), format_func=lambda x: opts[x])
-    if not sel:
+    if is_admin:
+        codes = st.multiselect(
+            "得意先を選択（複数可）",
+            options=list(opts.keys()),
+            default=list(opts.keys())[:1],
+            format_func=lambda x: opts[x],
+        )
+    else:
+        sel = st.selectbox("得意先を選択", options=list(opts.keys()), format_func=lambda x: opts[x])
+        codes = [sel] if sel else []
+    if not codes:
         return
 
+    def customer_block(code: str):
+        return st.expander(opts[code], expanded=True) if len(codes) > 1 else st.container()
+
     st.divider()
     st.markdown("##### 📦 現在の採用アイテム（稼働状況）")
+    # 得意先ごとに稼働状況・今期売上の順で番号を振り、得意先単位でページを切り出す（1社の行で枠が埋まらないように）
     sql_adopt = f"""
         SELECT
+            CAST(customer_code AS STRING) AS customer_code,
             product_name AS `商品名`,
             adoption_status AS `ステータス`,
             last_purchase_date AS `最終購入日`,
             current_fy_sales AS `今期売上`,
-            previous_fy_sales AS `前期売上`
+            previous_fy_sales AS `前期売上`,
+            ROW_NUMBER() OVER (
+              PARTITION BY CAST(customer_code AS STRING)
+              ORDER BY
+                CASE WHEN adoption_status LIKE '%🟢%' THEN 1 WHEN adoption_status LIKE '%🟡%' THEN 2 ELSE 3 END,
+                current_fy_sales DESC
+            ) AS row_no
         FROM `{VIEW_ADOPTION}`
-        WHERE CAST(customer_code AS STRING) = @c
-        ORDER BY
-            CASE WHEN adoption_status LIKE '%🟢%' THEN 1 WHEN adoption_status LIKE '%🟡%' THEN 2 ELSE 3 END,
-            current_fy_sales DESC
+        WHERE CAST(customer_code AS STRING) IN UNNEST(@codes)
+        QUALIFY row_no > @row_offset AND row_no <= @row_offset + @page_rows + 1
+        ORDER BY customer_code, row_no
     """
-    df_adopt = query_df_safe(client, sql_adopt, {"c": sel}, "Customer Adoption")
+
+    def fetch_adopt_page(page_codes: List[str], row_offset: int) -> Tuple[pd.DataFrame, List[str]]:
+        # 各社1件多く取得して「続きがあるか」を判定し、判定用の行は落とす（全件は読み込まない）
+        params = {"codes": page_codes, "row_offset": row_offset, "page_rows": ADOPTION_PREVIEW_ROWS}
+        df_page = query_df_safe(client, sql_adopt, params, "Customer Adoption")
+        if df_page.empty:
+            return df_page, []
+        extra = df_page["row_no"] > row_offset + ADOPTION_PREVIEW_ROWS
+        more_codes = df_page.loc[extra, "customer_code"].astype(str).unique().tolist()
+        return df_page[~extra], more_codes
+
+    # 読み込み済みの行は選択中の得意先の組み合わせごとにセッションへ保持し、「さらに読み込む」は次のページだけを取得する
+    adopt_state = st.session_state.get("adopt_pages")
+    if adopt_state is None or adopt_state["codes"] != tuple(codes):
+        df_first, more_codes = fetch_adopt_page(codes, 0)
+        adopt_state = {"codes": tuple(codes), "offset": ADOPTION_PREVIEW_ROWS, "df": df_first, "more": more_codes}
+        # 空（該当なし・クエリ失敗）は保持せず、次の再実行で引き直す
+        if not df_first.empty:
+            st.session_state["adopt_pages"] = adopt_state
+    df_adopt = adopt_state["df"].drop(columns="row_no", errors="ignore")
+    adopt_more_codes = adopt_state["more"]
+    adopt_money_cols = ["今期売上", "前期売上"]
     if not df_adopt.empty:
-        for col in ["今期売上", "前期売上"]:
-            df_adopt[col] = pd.to_numeric(df_adopt[col], errors="coerce").fillna(0)
-        st.dataframe(
-            df_adopt.style.format({"今期売上": "¥{:,.0f}", "前期売上": "¥{:,.0f}", "最終購入日": lambda t: t.strftime("%Y-%m-%d") if pd.notnull(t) else ""}),
-            use_container_width=True,
-            hide_index=True,
-        )
-    else:
-        st.info("この得意先の採用データはありません。")
+        if not all(is_numeric_dtype(df_adopt[col]) for col in adopt_money_cols):
+            df_adopt[adopt_money_cols] = df_adopt[adopt_money_cols].apply(pd.to_numeric, errors="coerce")
+        df_adopt[adopt_money_cols] = df_adopt[adopt_money_cols].to_numpy(dtype="float64", na_value=0.0)
+    adopt_column_config = display_column_config(adopt_money_cols, date_cols=["最終購入日"])
+    for code, df_one in iter_customer_frames(df_adopt, codes):
+        with customer_block(code):
+            if df_one.empty:
+                st.info("採用データはありません。")
+                continue
+            st.dataframe(
+                df_one,
+                use_container_width=True,
+                hide_index=True,
+                column_config=adopt_column_config,
+            )
+    if adopt_more_codes:
+        st.caption(f"各得意先の先頭 {adopt_state['offset']:,} 件まで表示中です（続きあり: {len(adopt_more_codes)} 社）。")
+        if st.button(f"さらに各 {ADOPTION_PREVIEW_ROWS} 件読み込む", key="btn_adopt_more"):
+            df_next, more_codes = fetch_adopt_page(adopt_more_codes, adopt_state["offset"])
+            df_all = pd.concat([adopt_state["df"], df_next], ignore_index=True)
+            adopt_state.update(
+                offset=adopt_state["offset"] + ADOPTION_PREVIEW_ROWS,
+                df=df_all.sort_values(["customer_code", "row_no"], kind="stable", ignore_index=True),
+                more=more_codes,
+            )
+            st.session_state["adopt_pages"] = adopt_state
+            st.rerun()
 
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown("##### 💡 AI 推奨提案商品（Reco）")
-    sql_rec = f"""
-        SELECT *
-        FROM `{VIEW_RECOMMEND}`
-        WHERE CAST(customer_code AS STRING) = @c
-        ORDER BY priority_rank ASC
-        LIMIT 10
-    """
-    df_rec = query_df_safe(client, sql_rec, {"c": sel}, "Recommendation")
-    if not df_rec.empty:
-        df_disp = df_rec[["priority_rank", "recommend_product", "manufacturer"]].rename(
-            columns={"priority_rank": "順位", "recommend_product": "推奨商品", "manufacturer": "メーカー"}
-        )
-        st.dataframe(df_disp, use_container_width=True, hide_index=True)
-    else:
-        st.info("現在、この得意先への推奨商品はありません。")
+    sql_rec = f"{SQL_RECOMMEND_BY_CUSTOMERS}LIMIT {REC_TOP_N * len(codes)}"
+    df_rec = query_df_safe(client, sql_rec, {"codes": codes}, "Recommendation")
+    for code, df_one in iter_customer_frames(df_rec, codes):
+        with customer_block(code):
+            if df_one.empty:
+                st.info("現在、この得意先への推奨商品はありません。")
+            else:
+                st.dataframe(df_one, use_container_width=True, hide_index=True)
 
 
 # -----------------------------
@@ -2015,25 +2806,22 @@ def main() -> None:
     set_page()
 
     if "use_bqstorage" not in st.session_state:
-        st.session_state["use_bqstorage"] = True
+        st.session_state["use_bqstorage"] = BQSTORAGE_AVAILABLE
 
     client = setup_bigquery_client()
 
-    unified_colmap = resolve_unified_colmap(client)
-    missing = unified_colmap.get("_missing_required")
-    if missing:
-        st.error(f"VIEW_UNIFIED の必須列が見つかりません。不足キー: {missing}")
-        st.stop()
-
-    nd_colmap = resolve_new_delivery_colmap(client)
-
     with st.sidebar:
         st.header("🔑 ログイン")
         login_id = st.text_input("ログインID (メールアドレス)")
         login_pw = st.text_input("パスコード (携帯下4桁)", type="password")
 
         st.divider()
-        st.checkbox("高速読込 (Storage API)", key="use_bqstorage")
+        st.checkbox(
+            "高速読込 (Storage API)",
+            key="use_bqstorage",
+            disabled=not BQSTORAGE_AVAILABLE,
+            help=None if BQSTORAGE_AVAILABLE else "google-cloud-bigquery-storage が未導入のため REST で取得します",
+        )
 
         if st.button("📡 通信ヘルスチェック"):
             try:
@@ -2045,17 +2833,37 @@ def main() -> None:
         if st.button("🧹 キャッシュクリア"):
             st.cache_data.clear()
             st.cache_resource.clear()
+            for k in (
+                "role_cache_key",
+                "role_cache_role",
+                "bootstrap_cache_key",
+                "bootstrap_cache",
+                "nd_parent_cache",
+                "nd_summary_loaded",
+                "nd_summary_df",
+                "adopt_pages",
+            ):
+                st.session_state.pop(k, None)
             st.success("キャッシュをクリアしました（再読み込みしてください）")
 
+    boot = bootstrap_metadata(client, (login_id or "").strip(), (login_pw or "").strip())
+    unified_colmap = boot.unified_colmap
+    missing = unified_colmap.get("_missing_required")
+    if missing:
+        st.error(f"VIEW_UNIFIED の必須列が見つかりません。不足キー: {missing}")
+        st.stop()
+
     if not login_id or not login_pw:
         st.info("👈 サイドバーからログインしてください。")
         return
 
-    role = resolve_role(client, login_id.strip(), login_pw.strip())
+    role = boot.role
     if not role.is_authenticated:
         st.error("❌ ログイン情報が正しくありません。")
         return
 
+    nd_colmap = boot.nd_colmap
+
     st.success(f"🔓 ログイン中: {role.staff_name} さん")
     c1_, c2_, c3_ = st.columns(3)
     c1_.metric("👤 担当", role.staff_name)
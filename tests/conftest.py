@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# app.py はパッケージ化していないので、リポジトリ直下を import パスに加える
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,68 @@
+import datetime
+
+import db_dtypes
+import pandas as pd
+import pyarrow as pa
+
+import app
+
+
+def _arrow_to_pandas(table: pa.Table, types: dict) -> pd.DataFrame:
+    # _job_to_dataframe の大きい結果（to_arrow 経由）と同じ変換
+    return table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=types.get)
+
+
+def test_large_result_types_match_to_dataframe_defaults():
+    table = pa.table(
+        {
+            "n": pa.array([1, None], pa.int64()),
+            "flag": pa.array([True, None], pa.bool_()),
+            "d": pa.array([datetime.date(2026, 4, 1), None], pa.date32()),
+            "t": pa.array([datetime.time(9, 30), None], pa.time64("us")),
+        }
+    )
+    df = _arrow_to_pandas(table, app._ARROW_TYPES)
+    assert df["n"].dtype == pd.Int64Dtype()
+    assert df["flag"].dtype == pd.BooleanDtype()
+    assert df["d"].dtype == db_dtypes.DateDtype()
+    assert df["t"].dtype == db_dtypes.TimeDtype()
+
+
+def test_arrow_strings_keep_date_mapping():
+    table = pa.table({"name": ["a", None], "d": pa.array([datetime.date(2026, 4, 1), None], pa.date32())})
+    df = _arrow_to_pandas(table, app._ARROW_TYPES_WITH_STRINGS)
+    assert df["name"].dtype == app.ARROW_STRING_DTYPE
+    assert df["d"].dtype == db_dtypes.DateDtype()
+
+
+def test_out_of_range_dates_fall_back_to_object():
+    table = pa.table({"d": pa.array([datetime.date(2026, 4, 1), datetime.date(9999, 12, 31)], pa.date32())})
+    df = _arrow_to_pandas(table, app._arrow_types_for(table, arrow_strings=False))
+    assert df["d"].dtype == object
+    assert df["d"].iloc[1] == datetime.date(9999, 12, 31)
+
+
+def test_in_range_dates_keep_dbdate():
+    table = pa.table({"d": pa.array([datetime.date(2026, 4, 1), None], pa.date32())})
+    assert app._arrow_types_for(table, arrow_strings=True) is app._ARROW_TYPES_WITH_STRINGS
+
+
+def test_list_params_are_string_arrays():
+    # 呼び出し側は CAST(... AS STRING) IN UNNEST(@x) で比較するので、整数のリストも STRING 配列で送る
+    param = app._build_query_parameter("codes", [101, 102, None])
+    assert param.array_type == "STRING"
+    assert param.values == ["101", "102", None]
+
+
+def test_iter_customer_frames_yields_every_selected_code():
+    df = pd.DataFrame({"customer_code": ["A", "A", "C"], "商品名": ["x", "y", "z"]})
+    frames = dict(app.iter_customer_frames(df, ["A", "B", "C"]))
+    assert list(frames) == ["A", "B", "C"]
+    assert frames["A"]["商品名"].tolist() == ["x", "y"]
+    assert frames["B"].empty and list(frames["B"].columns) == ["商品名"]
+
+
+def test_iter_customer_frames_handles_failed_query_frame():
+    frames = list(app.iter_customer_frames(pd.DataFrame(), ["A"]))
+    assert [code for code, _ in frames] == ["A"]
+    assert frames[0][1].empty
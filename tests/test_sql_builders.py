@@ -0,0 +1,85 @@
+import re
+from typing import List
+
+import pytest
+
+import app
+
+UNIFIED_COLMAP = {
+    "manufacturer": "manufacturer",
+    "total_drug_price": "total_drug_price",
+    "fiscal_year": "fiscal_year",
+    "sales_date": "sales_date",
+    "sales_amount": "sales_amount",
+    "gross_profit": "gross_profit",
+    "login_email": "login_email",
+}
+
+_CTE_HEAD_RE = re.compile(r"\s*([A-Za-z_][A-Za-z0-9_]*)\s+AS\s*\(", re.IGNORECASE)
+
+
+def _skip_parens(sql: str, open_pos: int) -> int:
+    # open_pos の "(" に対応する ")" の直後の位置を返す（文字列リテラル・識別子の中の括弧は数えない）
+    depth = 0
+    quote = ""
+    for pos in range(open_pos, len(sql)):
+        ch = sql[pos]
+        if quote:
+            if ch == quote:
+                quote = ""
+        elif ch in "'`\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+    raise AssertionError("WITH 句の括弧が閉じていません")
+
+
+def parse_cte_names(sql: str) -> List[str]:
+    # WITH name AS (...), name AS (...) SELECT ... の形であることを確かめながら CTE 名を返す
+    body = sql.strip()
+    assert body.upper().startswith("WITH"), "WITH 句で始まっていません"
+    pos = len("WITH")
+    names: List[str] = []
+    while True:
+        m = _CTE_HEAD_RE.match(body, pos)
+        assert m, f"CTE の定義が読めません: {body[pos:pos + 40]!r}"
+        names.append(m.group(1))
+        pos = _skip_parens(body, m.end() - 1)
+        rest = body[pos:].lstrip()
+        if rest.startswith(","):
+            pos = len(body) - len(rest) + 1
+            continue
+        assert rest.upper().startswith("SELECT"), f"CTE の後にカンマも SELECT もありません: {rest[:40]!r}"
+        return names
+
+
+def test_manufacturer_perf_sql_cte_list_is_well_formed():
+    where_sql = app._compose_where("login_email = @login_email", app.fy_window_sql(UNIFIED_COLMAP))
+    sql = app.build_manufacturer_perf_sql(UNIFIED_COLMAP, where_sql)
+    assert parse_cte_names(sql) == ["channel_map", "base", "agg"]
+
+
+def test_manufacturer_perf_sql_without_filters():
+    sql = app.build_manufacturer_perf_sql(UNIFIED_COLMAP, "")
+    assert parse_cte_names(sql) == ["channel_map", "base", "agg"]
+
+
+def test_cte_parser_rejects_missing_comma():
+    with pytest.raises(AssertionError):
+        parse_cte_names("WITH a AS (SELECT 1) b AS (SELECT 2) SELECT * FROM b")
+
+
+def test_org_summary_sql_does_not_depend_on_login():
+    # 全社サマリーは管理者間で共有キャッシュするので、担当者パラメータを参照しない
+    sql = app.build_summary_sql(UNIFIED_COLMAP, ("ORG",))
+    assert "@login_email" not in sql
+    assert parse_cte_names(sql)[0] == "base"
+
+
+def test_me_summary_sql_filters_by_login():
+    sql = app.build_summary_sql(UNIFIED_COLMAP, ("ME",))
+    assert "@login_email" in sql